@@ -1,12 +1,26 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+import numpy as np
 import seaborn as sns
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from css_report.correlation import csv_correlation, frame_correlation, upload_correlation
+from css_report.cube import DIMENSIONS, MEASURES, STATISTICS, coffee_cube
+from css_report.datasets import dataset_fingerprint, dataset_path, load_dataset, memory_report
+from css_report.figures import cached_png, pairplot
+from css_report.filtering import find_rows, keyword_filter
+from css_report.ingest import READ_ERRORS, load_upload, upload_fingerprint
+from css_report.memory_tracker import admin, memory_view, snapshot_every, track_memory
+from css_report.paging import FrameSource, paged_table
+from css_report.profiling import fragment, section, show_profile, start_profile
+from css_report.query import InvalidQuery, query_rows
+from css_report.sqlite_store import SqlSource, sqlite_upload
+from css_report.plotly_charts import bar, cached_figure, histogram, line, plotly_figure_cache
+from css_report.search_index import search_index
 #%%
-#set up title and navigation pane
+#set up title
 
 st.set_page_config(layout="wide")
+start_profile()
 st.title("Coding Summer School Report")
 
 st.markdown("""
@@ -23,13 +37,11 @@ st.markdown("""
 
 st.write("Website made by Sarah Burnett and Francois Conradie")
 
-tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10= st.tabs(["General", "File path modifier", "Pandas", "Plotting packages", "Streamlit", "Web scraping", 
-                                                               "Bashcrawl", "Resources", "About the authors", "Website code"])
-
 #%%
 #make the pages
+#each page is a function so that only the selected page runs on a rerun
 
-with tab1:
+def general_page():
     st.title("General")
     
     st.header("Tips")
@@ -64,7 +76,7 @@ with tab1:
                 - tensorflow (ts) is a machine learning library
                 """)
 
-with tab2:
+def file_path_page():
     st.title("File path modifier")
     st.write("""Often, one whas to change file names and input directories into a data analysis program and it can take long
      to manually change file/directory names. The Python package os can be used to find and create directories and make changes to file names
@@ -168,7 +180,7 @@ with tab2:
     """
     st.code(code_file_path)
     
-with tab3:
+def pandas_page():
     st.title("Pandas")
     
     st.write("""
@@ -249,8 +261,72 @@ with tab3:
     groups=df.groupby("Location")["Profit"].mean()
     st.write(groups)
     
+    st.write("""Choose data types when reading a file. Labels that repeat can be stored as a `category`, Yes/No columns as `bool` and 
+             numbers in the smallest type that fits them. This is how much memory the files used on this website take with the default 
+             types and with declared types""")
+    st.code("""
+            animals = pd.read_csv('super-animals.csv', dtype={"Species": "category", "Age": "float32", "Updated": "bool"},
+                                  true_values=["Yes"], false_values=["No"])
+            """)
+    col1, col2 = st.columns(2, gap='large')
+    with col1:
+        st.write('super-animals.csv')
+        st.dataframe(memory_report('super-animals.csv'))
+    with col2:
+        st.write('CoffeeTruck.csv')
+        st.dataframe(memory_report('CoffeeTruck.csv'))
+    
+    
+def coffee_truck_page():
+    st.title("Coffee truck analytics")
+    
+    st.write("""
+             CoffeeTruck.csv records the sales of a coffee truck at different locations, playing different music and charging different 
+             prices. Sums, counts, minimums and maximums for every combination of location, music and price bucket are worked out once 
+             when the page first loads. Changing the selections below combines those totals instead of going through the rows again.
+             """)
+    cube = coffee_cube()
+    
+    col1, col2, col3 = st.columns(3)
+    group_by = col1.multiselect("Group by", DIMENSIONS, default=["Location"])
+    measure = col2.selectbox("Measure", MEASURES, index=MEASURES.index("Profit"))
+    statistic = col3.selectbox("Statistic", STATISTICS, index=STATISTICS.index("mean"))
     
-with tab4:
+    filters = {}
+    for col, dimension in zip(st.columns(len(DIMENSIONS)), DIMENSIONS):
+        values = cube.values(dimension)
+        chosen = col.multiselect(dimension, values, default=values)
+        if len(chosen) < len(values):
+            filters[dimension] = chosen
+    
+    result = cube.query(group_by, filters, measure, statistic)
+    col1, col2 = st.columns([1,2], gap='large')
+    with col1:
+        st.dataframe(result)
+    with col2:
+        if len(group_by) == 1:
+            st.bar_chart(result)
+    st.caption(f"{cube.rows:,} rows summarised in {cube.cells} precomputed cells")
+    
+    st.subheader("Query the rows")
+    st.write("""
+             Conditions are written like pandas' DataFrame.query, for example Profit < 0 and Location == 'Park'. They are checked before
+             running, so only column names, numbers, text and comparisons are allowed.
+             """)
+    coffee = load_dataset('CoffeeTruck.csv')
+    coffee_id = ('CoffeeTruck.csv', dataset_fingerprint('CoffeeTruck.csv'))
+    expression = st.text_input("Condition", "Profit < 0 and Location == 'Park'", key="coffee_query_text")
+    if expression:
+        try:
+            rows = query_rows(coffee, coffee_id, expression)
+        except InvalidQuery as error:
+            st.error(str(error))
+        else:
+            st.write(f"{len(rows):,} of {len(coffee):,} rows match")
+            paged_table(FrameSource(coffee, coffee_id, rows), key="coffee_query")
+    
+    
+def plotting_page():
     st.title("Plotting packages")
     
     st.header("Seaborn")
@@ -261,7 +337,9 @@ with tab4:
              as heatmaps, correlation tables and much more. It works very conviniently with dataframe style data.
              """)
     
-    animals = pd.read_csv('super-animals.csv')
+    animals = load_dataset('super-animals.csv')
+    #rendered plots are cached on the file's fingerprint and the plot's parameters
+    animals_id = ('super-animals.csv', dataset_fingerprint('super-animals.csv'))
              
     st.subheader("Basic plots")
        
@@ -273,25 +351,29 @@ with tab4:
             """)
     
     
-    hist=sns.histplot(data = animals, x = "Size", color = "lightblue",edgecolor = "blue",bins = 10).set_title("Histogram of the size (in cm) of the animals")
+    #each plot gets its own Figure instead of sharing pyplot's current figure
+    def draw_hist():
+        fig = Figure()
+        sns.histplot(data = animals, x = "Size", color = "lightblue",edgecolor = "blue",bins = 10, ax = fig.subplots()).set_title("Histogram of the size (in cm) of the animals")
+        return fig
     
     col1, col2, col3 = st.columns([2,3,2], gap='large')
     with col2:
-        st.pyplot(hist.get_figure()) 
-        
-    plt.clf()
+        st.image(cached_png(("histplot", animals_id, "Size", 10), draw_hist), use_container_width=True)
         
     st.code("""
             spec = sns.barplot(x= animals["Species"].value_counts().index, y=animals["Species"].value_counts().values).set_title("Barplot of the species of animals")
             st.pyplot(spec.get_figure())
             """)   
         
-    spec = sns.barplot(x= animals["Species"].value_counts().index, y=animals["Species"].value_counts().values).set_title("Barplot of the species of animals")
+    def draw_species():
+        fig = Figure()
+        sns.barplot(x= animals["Species"].value_counts().index, y=animals["Species"].value_counts().values, ax = fig.subplots()).set_title("Barplot of the species of animals")
+        return fig
+    
     col1, col2, col3 = st.columns([2,3,2], gap='large')
     with col2:
-        st.pyplot(spec.get_figure())
-        
-    plt.clf()
+        st.image(cached_png(("barplot", animals_id, "Species"), draw_species), use_container_width=True)
     
     st.subheader("Statistical plots")
     
@@ -302,19 +384,25 @@ with tab4:
             """)
     col1, col2, col3 = st.columns([1,3,1], gap='large')
     with col2:
-        pair=sns.pairplot(animals.loc[:,["Age", "Weight", "Size", "Speed"]])
-        st.pyplot(pair)
+        #above a row threshold this switches to binned density panels
+        def draw_pair():
+            return pairplot(animals, ["Age", "Weight", "Size", "Speed"])
+        st.image(cached_png(("pairplot", animals_id, "Age", "Weight", "Size", "Speed"), draw_pair), use_container_width=True)
         
     st.write("A heatmap")
-    plt.clf()
     st.code("""
             heat=sns.heatmap(animals.loc[:,["Age", "Weight", "Size", "Speed"]].corr())
             st.pyplot(heat.get_figure())
             """)
     col1, col2, col3 = st.columns([3,3,3], gap='large')
     with col2:
-        heat=sns.heatmap(animals.loc[:,["Age", "Weight", "Size", "Speed"]].corr())
-        st.pyplot(heat.get_figure())
+        def draw_heat():
+            fig = Figure()
+            #the correlations come from statistics streamed once over the file and kept up to date
+            corr = csv_correlation(dataset_path('super-animals.csv'), ["Age", "Weight", "Size", "Speed"])
+            sns.heatmap(corr, ax = fig.subplots())
+            return fig
+        st.image(cached_png(("heatmap", animals_id, "Age", "Weight", "Size", "Speed"), draw_heat), use_container_width=True)
         
     st.header("Plotly")
     st.write("Plotly is a library that allows you to create interactive plots")
@@ -323,18 +411,146 @@ with tab4:
             plot_hist = px.histogram(animals, x="Size")
             st.plotly_chart(plot_hist)
             """)
-    plot_hist = px.histogram(animals, x="Size")
+    #binned and grouped here so the browser gets one bar per bin or group instead of every row
+    #figures are built once per process for each dataset version and shared by every session
+    plot_hist = cached_figure(("histogram", animals_id, "Size"), lambda: histogram(animals, "Size"))
     st.plotly_chart(plot_hist)
     
     st.code("""
             plot_bar=px.bar(animals, x=animals["Species"], y='Number')
             st.plotly_chart(plot_bar)
             """)    
-    plot_bar=px.bar(animals, x=animals["Species"], y='Number')
+    plot_bar=cached_figure(("bar", animals_id, "Species", "Number"), lambda: bar(animals, "Species", "Number"))
     st.plotly_chart(plot_bar)
     
+    cache = plotly_figure_cache()
+    st.caption(f"Plotly figure cache: {cache.hits} hits, {cache.misses} misses, {cache.saved_seconds:.2f} s of building saved")
+    
     
-with tab5:
+@st.cache_resource
+def long_trace():
+    time = np.linspace(0, 100, 2_000_000)
+    noise = np.random.default_rng(0).normal(0, 0.1, len(time))
+    return pd.DataFrame({"time": time, "signal": np.sin(time) * np.exp(-time / 50) + noise})
+
+
+#each demo is a fragment, so using its widgets only reruns the demo and not the charts on the rest of the page
+
+@fragment("Long trace demo")
+def long_trace_demo():
+    trace = long_trace()
+    x_range = st.slider("Time range", 0.0, 100.0, (0.0, 100.0), step=0.1)
+    method = st.radio("Downsampling", ["lttb", "minmax"], horizontal=True,
+                      format_func={"lttb": "Largest triangle (LTTB)", "minmax": "Min/max per bucket"}.get)
+    st.plotly_chart(cached_figure(("line", "long trace", x_range, method),
+                                  lambda: line(trace, "time", "signal", title=f"{len(trace):,} point trace", x_range=x_range, method=method)))
+
+
+@fragment("Upload demo")
+def upload_demo():
+    uploaded_file = st.file_uploader("Upload a CSV of sale data", type="csv")
+
+    upload = store = None
+    if uploaded_file:
+        on_disk = st.toggle("Keep the file on disk", key="upload_on_disk",
+                            help="Copies the file into SQLite and runs the table, filter and summary as queries there, for files too big to load into memory")
+        if on_disk:
+            upload_id = upload_fingerprint(uploaded_file)
+            try:
+                store = sqlite_upload(upload_id, uploaded_file.getvalue())
+            except READ_ERRORS as error:
+                st.error(f"Could not read {uploaded_file.name}: {error}")
+        else:
+            upload_id, upload = load_upload(uploaded_file)
+
+    if store is not None:
+        paged_table(SqlSource(store), key="upload")
+        
+        keyword = st.text_input("Filter by keyword", "")
+        match = st.radio("Match", ["Part of a cell", "Whole cell"], horizontal=True)
+        if keyword:
+            where, params = store.keyword_where(keyword, match == "Whole cell")
+            st.write(f"Filtered Results for '{keyword}':")
+            paged_table(SqlSource(store, where, params), key="filtered")
+        else:
+            st.write("Showing all sales")
+
+    if upload is not None:
+        paged_table(FrameSource(upload, upload_id), key="upload")
+
+        # Add filtering for year or keyword
+        keyword = st.text_input("Filter by keyword", "")
+        match = st.radio("Match", ["Part of a cell", "Whole cell"], horizontal=True)
+        use_index = st.checkbox("Use a search index", help="Worth it when you search the same large file many times")
+        if keyword:
+            search = keyword_filter(upload_id, upload)
+            index = None
+            if use_index:
+                index = search_index(upload_id, search)
+                st.caption(f"Search index built in {index.build_seconds:.2f} s and uses {index.nbytes / 1e6:.1f} MB")
+            rows = find_rows(upload_id, search, keyword, match == "Whole cell", index)
+            st.write(f"Filtered Results for '{keyword}':")
+            paged_table(FrameSource(upload, upload_id, rows), key="filtered")
+        else:
+            st.write("Showing all sales")
+        
+        condition = st.text_input("Filter by condition", "", placeholder="e.g. Profit > 100 and Music == 'HipHop'")
+        if condition:
+            try:
+                rows = query_rows(upload, upload_id, condition)
+            except InvalidQuery as error:
+                st.error(str(error))
+            else:
+                st.write(f"{len(rows):,} rows where {condition}:")
+                paged_table(FrameSource(upload, upload_id, rows), key="condition")
+        
+    if store is not None or upload is not None:
+        numeric = store.numeric_columns if store is not None else list(upload.select_dtypes("number").columns)
+        columns = store.columns if store is not None else list(upload.columns)
+        if numeric and st.checkbox("Summarise the sales by group"):
+            col1, col2, col3 = st.columns(3)
+            labels = [i for i, column in enumerate(columns) if column not in numeric]
+            group = col1.selectbox("Group by", columns, index=labels[0] if labels else 0, key="upload_group")
+            measure = col2.selectbox("Measure", numeric, index=len(numeric) - 1, key="upload_measure")
+            statistic = col3.selectbox("Statistic", STATISTICS, key="upload_statistic")
+            if store is not None:
+                summary = store.group_by(group, measure, statistic)
+            else:
+                summary = upload.groupby(group, observed=True)[measure].agg(statistic)
+            st.dataframe(summary)
+        
+        if st.checkbox("Show correlations between the numeric columns"):
+            if store is not None:
+                #streamed over the file in chunks, so this works for files too big to load
+                corr = upload_correlation(upload_id, uploaded_file.getvalue())
+            else:
+                #only the columns and rows chosen before the file was parsed
+                corr = frame_correlation(upload_id, upload)
+            if corr.empty:
+                st.write("The file has no numeric columns")
+            else:
+                def draw_upload_heat():
+                    fig = Figure()
+                    sns.heatmap(corr, ax = fig.subplots())
+                    return fig
+                col1, col2, col3 = st.columns([3,3,3], gap='large')
+                with col2:
+                    st.image(cached_png(("heatmap", upload_id), draw_upload_heat), use_container_width=True)
+
+
+@fragment("Text area demo")
+def text_demo():
+    text=st.text_area('Write some text here')
+    st.write(f"You wrote: {text}")
+
+
+@fragment("Slider demo")
+def slider_demo():
+    number = st.slider("Pick a number", 1, 100)
+    st.write(f"You picked: {number}")
+
+
+def streamlit_page():
     st.title("Streamlit")
     st.write("""
              Streamlit is a very powerful tool to create web apps. It was used to create this website! It can host pages locally or via Github. You write the code for the 
@@ -355,8 +571,8 @@ with tab5:
     # Display the data in the Streamlit app
     st.write(data)
 
-    # Create a Plotly figure
-    fig = px.line(data, x="x", y="y", title="Simple Plotly Example")
+    # Create a Plotly figure, downsampled if the trace is longer than the chart can show
+    fig = cached_figure(("line", "example"), lambda: line(data, "x", "y", title="Simple Plotly Example"))
     
     # Display the plot in the Streamlit app
     st.plotly_chart(fig)
@@ -376,25 +592,17 @@ with tab5:
 
     
     
+    st.subheader("Long traces")
+    st.write("""Instrument traces can have millions of points, which is far more than a chart can show. The trace below is 
+             downsampled to 2000 points that keep its shape (LTTB) or its extremes (min/max). Narrowing the range reads that part 
+             of the trace at a finer resolution.""")
+    long_trace_demo()
+    
+    
     st.header("Other features")
     
     st.subheader('Upload a file and filter the results')
-    uploaded_file = st.file_uploader("Upload a CSV of sale data", type="csv")
-
-    if uploaded_file:
-        upload = pd.read_csv(uploaded_file)
-        st.dataframe(upload)
-
-        # Add filtering for year or keyword
-        keyword = st.text_input("Filter by keyword", "")
-        if keyword:
-            filtered = upload[
-                upload.apply(lambda row: keyword.lower() in row.astype(str).str.lower().values, axis=1)
-            ]
-            st.write(f"Filtered Results for '{keyword}':")
-            st.dataframe(filtered)
-        else:
-            st.write("Showing all sales")
+    upload_demo()
             
     st.code("""
             uploaded_file = st.file_uploader("Upload a CSV of sale data", type="csv")
@@ -416,8 +624,7 @@ with tab5:
             """)
         
     st.subheader('Take text input')
-    text=st.text_area('Write some text here')
-    st.write(f"You wrote: {text}")
+    text_demo()
     
     st.code("""
             text=st.text_area('Write some text here')
@@ -425,8 +632,7 @@ with tab5:
             """)
 
     st.subheader('Take input from a slider')
-    number = st.slider("Pick a number", 1, 100)
-    st.write(f"You picked: {number}")
+    slider_demo()
     
     st.code("""
             number = st.slider("Pick a number", 1, 100)
@@ -437,7 +643,7 @@ with tab5:
     st.link_button('Noughts and crosses', 'https://css2025app-noughtsandcrosses-9rqynctvxelsbvsk76ih5q.streamlit.app/', type='primary')
     
     
-with tab6:
+def web_scraping_page():
     st.title("Web scraping")
     
     st.markdown("""Web scraping is the process of automatically extracting data from a website. We used the `request` library to do this.
@@ -457,7 +663,7 @@ with tab6:
     
     
     
-with tab7:
+def bashcrawl_page():
     st.title("Bashcrawl")
     st.markdown("""Bashcrawl is a fun DnD style game to teach you basic bash commands. You explore rooms, fight monsters and solve puzzles. 
                 Bash is a command-line interface that allows users to interact with the system using text commands""")
@@ -482,7 +688,7 @@ with tab7:
     
     
     
-with tab8:
+def resources_page():
     st.title("Resources")
     
     st.link_button('Automate the Boring Stuff', 'https://automatetheboringstuff.com/', type='primary', 
@@ -500,7 +706,7 @@ with tab8:
     st.link_button("W3 School Python tutorials", 'https://www.w3schools.com/python/default.asp', type='primary',
                    help='Text based tutorials to learn Python from the beginning')
     
-with tab9:
+def authors_page():
     st.subheader("Sarah Burnett")
     st.write("""
              Sarah Burnett is a MSc student in the Biophysics Research Group at the University of Pretoria.\\
@@ -547,7 +753,7 @@ with tab9:
         st.link_button("Follow us on Instagram", "https://www.instagram.com/biophysics.up/", type='primary')
         st.link_button("Follow us on LinkedIn", "https://www.linkedin.com/company/biophysics-research-group-tuks/", type='primary')
 
-with tab10:
+def website_code_page():
     code='''
     import streamlit as st
     import pandas as pd
@@ -1027,3 +1233,30 @@ with tab10:
     
     st.code(code)
 
+def memory_page():
+    st.title("Memory")
+    st.write("Growth of the memory traced by tracemalloc, found by comparing snapshots taken between reruns.")
+    memory_view()
+
+#%%
+#set up navigation pane
+
+pages = [st.Page(general_page, title="General", url_path="general", default=True),
+         st.Page(file_path_page, title="File path modifier", url_path="file-path-modifier"),
+         st.Page(pandas_page, title="Pandas", url_path="pandas"),
+         st.Page(coffee_truck_page, title="Coffee truck analytics", url_path="coffee-truck-analytics"),
+         st.Page(plotting_page, title="Plotting packages", url_path="plotting-packages"),
+         st.Page(streamlit_page, title="Streamlit", url_path="streamlit"),
+         st.Page(web_scraping_page, title="Web scraping", url_path="web-scraping"),
+         st.Page(bashcrawl_page, title="Bashcrawl", url_path="bashcrawl"),
+         st.Page(resources_page, title="Resources", url_path="resources"),
+         st.Page(authors_page, title="About the authors", url_path="about-the-authors"),
+         st.Page(website_code_page, title="Website code", url_path="website-code")]
+if snapshot_every() and admin():
+    pages.append(st.Page(memory_page, title="Memory", url_path="memory"))
+
+page = st.navigation(pages)
+with section(page.title):
+    page.run()
+show_profile()
+track_memory()
@@ -0,0 +1,81 @@
+"""Check that rerunning the Plotting packages page doesn't leak figures or memory.
+
+    python benchmarks/figure_leaks.py --reruns 1000
+
+Reruns the page with AppTest, clearing the PNG figure cache before every
+rerun so each one draws all of its matplotlib figures again. Fails, with
+exit status 1, if pyplot is left holding any figure after one is rendered or
+if the process's resident memory grows by more than ``--max-growth-mb``
+between the end of the warm-up reruns and the last rerun.
+
+Streamlit closes every pyplot figure when a full rerun ends, which would
+hide figures leaked during a rerun, so open figures are counted right after
+each render instead.
+"""
+import argparse
+import os
+import sys
+import time
+
+import matplotlib.pyplot as plt
+from streamlit.testing.v1 import AppTest
+from streamlit.util import calc_md5
+
+from fixtures import APP, ROOT, rss_mb
+
+sys.path.insert(0, ROOT)
+
+from css_report import figures  # noqa: E402
+
+open_figures = []
+
+
+def counting_render_png(figure, render_png=figures.render_png):
+    png = render_png(figure)
+    open_figures.append(len(plt.get_fignums()))
+    return png
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reruns", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="reruns before the memory baseline is taken, while caches fill up")
+    parser.add_argument("--max-growth-mb", type=float, default=50.0,
+                        help="largest RSS growth allowed after the warm-up")
+    args = parser.parse_args()
+
+    figures.render_png = counting_render_png
+    at = AppTest.from_file(APP, default_timeout=300)
+    at._page_hash = calc_md5("plotting-packages")
+    baseline = None
+    start = time.perf_counter()
+    for rerun in range(1, args.reruns + 1):
+        figures.figure_cache().clear()
+        open_figures.clear()
+        at.run()
+        if at.exception:
+            sys.exit(f"Rerun {rerun} raised: {at.exception[0].value}")
+        if not open_figures:
+            sys.exit(f"Rerun {rerun} rendered no figures, so there is nothing to check")
+        if max(open_figures):
+            sys.exit(f"FAIL: pyplot still held {max(open_figures)} figure(s) during rerun {rerun}")
+        if rerun == args.warmup:
+            baseline = rss_mb(os.getpid())
+        if rerun % 100 == 0:
+            print(f"{rerun} reruns, {time.perf_counter() - start:.0f} s, RSS {rss_mb(os.getpid()) or 0:.0f} MB",
+                  flush=True)
+    end = rss_mb(os.getpid())
+    if baseline is None or end is None:
+        print(f"No open figures after {args.reruns} reruns; RSS not checked (needs /proc and more than "
+              f"{args.warmup} reruns)")
+        return
+    growth = end - baseline
+    print(f"No open figures after {args.reruns} reruns; RSS {baseline:.0f} MB after warm-up, {end:.0f} MB at the end")
+    if growth > args.max_growth_mb:
+        sys.exit(f"FAIL: RSS grew by {growth:.0f} MB, more than the {args.max_growth_mb:.0f} MB allowed")
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""CSS-notes.py with the file uploader answering with a fixture file.
+
+AppTest can't drive st.file_uploader, so benchmarks run this script instead.
+The fixture path comes from CSS_REPORT_FIXTURE_UPLOAD; without it the
+uploader returns nothing, as if no file was chosen.
+"""
+import io
+import os
+import runpy
+
+import streamlit as st
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CSS-notes.py")
+
+
+@st.cache_resource(show_spinner=False)
+def _read(path):
+    #a real upload is held in memory by the session, so don't time reading it from disk on every rerun
+    with open(path, "rb") as file:
+        return file.read()
+
+
+class FixtureUpload(io.BytesIO):
+    def __init__(self, path):
+        super().__init__(_read(path))
+        self.name = os.path.basename(path)
+        self.size = len(self.getvalue())
+        self.file_id = f"fixture-{self.name}"
+
+
+def _fixture_uploader(label, *args, **kwargs):
+    path = os.environ.get("CSS_REPORT_FIXTURE_UPLOAD")
+    return FixtureUpload(path) if path else None
+
+
+st.file_uploader = _fixture_uploader
+runpy.run_path(APP, run_name="__main__")
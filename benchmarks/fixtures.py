@@ -0,0 +1,44 @@
+"""Test data shared by the benchmark and load-test tools."""
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, "CSS-notes.py")
+COFFEE_TRUCK = os.path.join(ROOT, "CoffeeTruck.csv")
+
+#url paths of the report's pages
+PAGES = ["general", "file-path-modifier", "pandas", "coffee-truck-analytics", "plotting-packages", "streamlit",
+         "web-scraping", "bashcrawl", "resources", "about-the-authors", "website-code"]
+
+#values set in turn on the Streamlit page's slider and text area, and keywords typed into the upload filter
+SLIDER_VALUES = [10, 50, 90, 25, 75]
+TEXT_AREA_VALUES = ["hello", "hello world", "coffee truck", "", "the report"]
+KEYWORDS = ["park", "zoo", "hiphop", "1792", "alternative"]
+
+
+def scaled_csv(path, factor, source=COFFEE_TRUCK):
+    """Write ``source`` with its rows repeated ``factor`` times, reusing the file if it exists."""
+    if os.path.exists(path):
+        return path
+    with open(source, "rb") as file:
+        header, _, body = file.read().partition(b"\n")
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    partial = f"{path}.tmp"
+    with open(partial, "wb") as file:
+        file.write(header + b"\n")
+        for _ in range(factor):
+            file.write(body)
+    os.replace(partial, path)
+    return path
+
+
+def rss_mb(pid):
+    """Resident memory of a process from /proc, or None where there is no /proc."""
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
@@ -0,0 +1,74 @@
+"""Check that the widget demos on the Streamlit page rerun on their own.
+
+    python benchmarks/fragments.py
+
+Each demo is an st.fragment, so the browser asks for a rerun of just that
+fragment when one of its widgets changes. AppTest always reruns the whole
+script, so this check talks to a real ``streamlit run`` instead, using the
+load test's client. For every demo it changes a widget and fails if the
+rerun wasn't a fragment run or sent any chart, which would mean the
+plotting code of the page ran again. Exits with status 1 on failure.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+from fixtures import scaled_csv
+from load_test import RerunFailed, Session, start_server, wait_until_healthy
+
+CHARTS = {"plotly_chart", "imgs", "arrow_vega_lite_chart", "vega_lite_chart", "deck_gl_json_chart"}
+
+
+def check(name, session):
+    """Problems with the latest rerun, as messages."""
+    problems = []
+    if session.status != ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY:
+        problems.append(f"{name}: reran the whole page instead of the fragment")
+    charts = CHARTS.intersection(session.elements)
+    if charts:
+        problems.append(f"{name}: sent {', '.join(sorted(charts))} again")
+    if "exception" in session.elements:
+        problems.append(f"{name}: the app showed an exception")
+    print(f"{name}: {len(session.elements)} element(s) sent, {'FAIL' if problems else 'ok'}")
+    return problems
+
+
+async def check_fragments(upload):
+    base_url, server = start_server()
+    try:
+        await wait_until_healthy(base_url, server)
+        session = Session(base_url)
+        await session.connect()
+        await session.rerun(page="streamlit")
+        steps = [("text area", lambda: session.set_widget("text_area", "Write some text here", string_value="hello")),
+                 ("slider", lambda: session.set_widget("slider", "Pick a number", double_array_value={"data": [42]})),
+                 ("upload", lambda: session.upload("Upload a CSV of sale data", upload)),
+                 ("keyword filter", lambda: session.set_widget("text_input", "Filter by keyword", string_value="park"))]
+        problems = []
+        for name, step in steps:
+            try:
+                await step()
+            except RerunFailed as error:
+                problems.append(f"{name}: {error}")
+                continue
+            problems += check(name, session)
+        session.close()
+        return problems
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    upload = scaled_csv(os.path.join(tempfile.mkdtemp(prefix="css-report-fragments-"), "coffee.csv"), 1)
+    problems = asyncio.run(check_fragments(upload))
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Load test: many simulated users against a local ``streamlit run`` of the report.
+
+    python benchmarks/load_test.py --users 10 --duration 60
+
+Starts the report on a free localhost port, then runs ``--users`` clients that
+each talk to it over the same websocket protocol as the browser. Each user
+switches between pages, moves the slider on the Streamlit page, uploads
+CoffeeTruck.csv repeated ``--upload-scale`` times and filters it by keyword.
+Prints reruns per second, rerun latency percentiles per action and the
+server's resident memory. Nothing leaves the machine.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.Common_pb2 import FileURLsRequest, UploadedFileInfo
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from streamlit.util import calc_md5
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.websocket import websocket_connect
+
+from fixtures import APP, KEYWORDS, PAGES, ROOT, rss_mb, scaled_csv
+
+DONE = {ForwardMsg.FINISHED_SUCCESSFULLY, ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+        ForwardMsg.FINISHED_WITH_COMPILE_ERROR}
+
+
+class RerunFailed(Exception):
+    pass
+
+
+class Session:
+    """One browser tab: a websocket to the server plus the widget values the tab would send back.
+
+    Widget ids are read from the elements the server sends, so actions name
+    widgets by type and label as they appear on the page.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.page_hash = ""
+        self.states = {}
+        self.widgets = {}
+        self.messages = {}
+        self.session_id = None
+        self.cookie = None
+        self.errors = 0
+        #element types sent during the latest rerun, and how it finished
+        self.elements = []
+        self.status = None
+
+    async def connect(self):
+        url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.connection = await websocket_connect(url)
+        #the handshake sets the XSRF cookie that uploads have to echo back
+        cookies = self.connection.headers.get_list("Set-Cookie")
+        self.cookie = next((cookie.split(";")[0] for cookie in cookies if cookie.startswith("_streamlit_xsrf")), None)
+
+    def close(self):
+        self.connection.close()
+
+    async def send(self, msg):
+        await self.connection.write_message(msg.SerializeToString(), binary=True)
+
+    async def receive(self):
+        payload = await self.connection.read_message()
+        if payload is None:
+            raise RerunFailed("The server closed the connection")
+        msg = ForwardMsg()
+        msg.ParseFromString(payload)
+        if msg.HasField("ref_hash"):
+            msg = await self.cached_message(msg.ref_hash)
+        elif msg.metadata.cacheable:
+            self.messages[msg.hash] = msg
+        return msg
+
+    async def cached_message(self, ref_hash):
+        """A message the server only sent a reference to, because this tab should have it already."""
+        if ref_hash not in self.messages:
+            response = await AsyncHTTPClient().fetch(f"{self.base_url}/_stcore/message?hash={ref_hash}")
+            msg = ForwardMsg()
+            msg.ParseFromString(response.body)
+            self.messages[ref_hash] = msg
+        return self.messages[ref_hash]
+
+    def read(self, msg):
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            self.session_id = msg.new_session.initialize.session_id
+            self.page_hash = msg.new_session.page_script_hash
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            self.elements.append(element_type)
+            if element_type == "exception":
+                self.errors += 1
+            widget = getattr(element, element_type)
+            if hasattr(widget, "id") and hasattr(widget, "label") and widget.id:
+                self.widgets[element_type, widget.label] = (widget.id, msg.delta.fragment_id)
+        return kind
+
+    async def rerun(self, page=None, fragment_id=""):
+        """Ask for a rerun and wait until it has finished; returns the seconds it took."""
+        if page is not None:
+            self.page_hash = calc_md5(page)
+            self.widgets.clear()
+            self.states.clear()
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_hash
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        self.elements = []
+        start = time.perf_counter()
+        await self.send(msg)
+        while True:
+            msg = await self.receive()
+            if self.read(msg) == "script_finished" and msg.script_finished in DONE:
+                self.status = msg.script_finished
+                return time.perf_counter() - start
+
+    def widget(self, element_type, label):
+        try:
+            return self.widgets[element_type, label]
+        except KeyError:
+            raise RerunFailed(f"No {element_type} labelled {label!r} on the page") from None
+
+    async def set_widget(self, element_type, label, **value):
+        widget_id, fragment_id = self.widget(element_type, label)
+        state = WidgetState(id=widget_id, **value)
+        self.states[widget_id] = state
+        seconds = await self.rerun(fragment_id=fragment_id)
+        if "trigger_value" in value:
+            del self.states[widget_id]
+        return seconds
+
+    async def upload(self, label, path):
+        """Upload a file through the same endpoints as the browser, then rerun with it selected."""
+        widget_id, fragment_id = self.widget("file_uploader", label)
+        name = os.path.basename(path)
+        request = BackMsg()
+        request.file_urls_request.CopyFrom(FileURLsRequest(request_id=uuid.uuid4().hex, file_names=[name],
+                                                           session_id=self.session_id))
+        await self.send(request)
+        while True:
+            msg = await self.receive()
+            if self.read(msg) == "file_urls_response":
+                urls = msg.file_urls_response.file_urls[0]
+                break
+        with open(path, "rb") as file:
+            data = file.read()
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{name}\"\r\n"
+                f"Content-Type: text/csv\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        if self.cookie is not None:
+            headers["Cookie"] = self.cookie
+            headers["X-Xsrftoken"] = self.cookie.split("=", 1)[1]
+        upload_url = urls.upload_url if urls.upload_url.startswith("http") else self.base_url + urls.upload_url
+        start = time.perf_counter()
+        await AsyncHTTPClient().fetch(HTTPRequest(upload_url, method="PUT", headers=headers, body=body,
+                                                  request_timeout=600))
+        state = WidgetState(id=widget_id)
+        state.file_uploader_state_value.uploaded_file_info.append(
+            UploadedFileInfo(file_id=urls.file_id, name=name, size=len(data), file_urls=urls))
+        self.states[widget_id] = state
+        return time.perf_counter() - start + await self.rerun(fragment_id=fragment_id)
+
+
+async def user(base_url, upload, deadline, think, timings, failures, exceptions):
+    """One simulated user, repeating a visit to a random page and to the Streamlit page's demos."""
+    session = Session(base_url)
+    await session.connect()
+
+    async def act(action, step):
+        try:
+            timings[action].append(await step)
+        except RerunFailed as error:
+            failures[action].append(str(error))
+        await asyncio.sleep(random.uniform(0, think))
+
+    try:
+        await act("first load", session.rerun())
+        while time.perf_counter() < deadline:
+            await act("switch page", session.rerun(page=random.choice(PAGES)))
+            await act("switch page", session.rerun(page="streamlit"))
+            await act("slider", session.set_widget("slider", "Pick a number", double_array_value={
+                "data": [random.randint(1, 100)]}))
+            await act("upload", session.upload("Upload a CSV of sale data", upload))
+            if ("button", "Read file") in session.widgets:
+                await act("upload", session.set_widget("button", "Read file", trigger_value=True))
+            for keyword in random.sample(KEYWORDS, 2):
+                await act("keyword filter", session.set_widget("text_input", "Filter by keyword", string_value=keyword))
+    finally:
+        exceptions.append(session.errors)
+        session.close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def watch_rss(pid, samples, every=0.5):
+    while True:
+        rss = rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(every)
+
+
+def start_server(port=0, show_log=False):
+    """Launch ``streamlit run`` of the report on localhost; returns its URL and process."""
+    port = port or free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP, "--server.headless", "true", "--server.port", str(port),
+         "--server.address", "127.0.0.1", "--browser.gatherUsageStats", "false",
+         "--server.fileWatcherType", "none"],
+        cwd=ROOT, stdout=None if show_log else subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    return f"http://127.0.0.1:{port}", server
+
+
+async def wait_until_healthy(base_url, server, timeout=60):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("streamlit run exited before the server came up")
+        try:
+            await AsyncHTTPClient().fetch(f"{base_url}/_stcore/health", request_timeout=2)
+            return
+        except Exception:
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"The server did not answer within {timeout} s")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    values = sorted(values)
+    return values[max(math.ceil(q / 100 * len(values)), 1) - 1]
+
+
+def summarise(timings, failures, exceptions, elapsed, rss):
+    reruns = [seconds for values in timings.values() for seconds in values]
+    report = {"reruns": len(reruns), "seconds": elapsed, "reruns_per_second": len(reruns) / elapsed,
+              "exceptions_shown": sum(exceptions),
+              "failures": {action: len(errors) for action, errors in failures.items()}, "actions": {}}
+    for action, values in [("all", reruns)] + sorted(timings.items()):
+        if not values:
+            continue
+        report["actions"][action] = {"count": len(values), "p50_s": percentile(values, 50),
+                                     "p95_s": percentile(values, 95), "p99_s": percentile(values, 99),
+                                     "mean_s": statistics.fmean(values)}
+    if rss:
+        report["server_rss_mb"] = {"start": rss[0], "peak": max(rss), "end": rss[-1]}
+    return report
+
+
+def show(report):
+    print(f"{report['reruns']:,} reruns in {report['seconds']:.1f} s, {report['reruns_per_second']:.1f} reruns/s")
+    print(f"{'action':16} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for action, stats in report["actions"].items():
+        print(f"{action:16} {stats['count']:7,} {stats['p50_s'] * 1000:9.1f} {stats['p95_s'] * 1000:9.1f} "
+              f"{stats['p99_s'] * 1000:9.1f}")
+    if "server_rss_mb" in report:
+        rss = report["server_rss_mb"]
+        print(f"Server RSS: {rss['start']:.0f} MB at start, {rss['peak']:.0f} MB peak, {rss['end']:.0f} MB at end")
+    if report["exceptions_shown"]:
+        print(f"The app showed {report['exceptions_shown']} exception(s)")
+    for action, count in report["failures"].items():
+        print(f"{count} {action} action(s) failed")
+
+
+async def load_test(args):
+    workdir = tempfile.mkdtemp(prefix="css-report-load-")
+    upload = scaled_csv(os.path.join(workdir, f"coffee-x{args.upload_scale}.csv"), args.upload_scale)
+    base_url, server = start_server(args.port, args.server_log)
+    rss = []
+    try:
+        await wait_until_healthy(base_url, server)
+        watcher = asyncio.ensure_future(watch_rss(server.pid, rss))
+        timings, failures, exceptions = defaultdict(list), defaultdict(list), []
+        start = time.perf_counter()
+        deadline = start + args.duration
+        users = []
+        for _ in range(args.users):
+            users.append(asyncio.ensure_future(user(base_url, upload, deadline, args.think, timings, failures,
+                                                     exceptions)))
+            await asyncio.sleep(args.ramp / max(args.users, 1))
+        await asyncio.gather(*users)
+        elapsed = time.perf_counter() - start
+        watcher.cancel()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return summarise(timings, failures, exceptions, elapsed, rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to keep starting new actions")
+    parser.add_argument("--ramp", type=float, default=5, help="seconds over which the users join")
+    parser.add_argument("--think", type=float, default=0.5, help="longest random pause between actions, in seconds")
+    parser.add_argument("--upload-scale", type=int, default=20,
+                        help="times CoffeeTruck.csv is repeated in the uploaded file")
+    parser.add_argument("--port", type=int, default=0, help="port for the server (default: any free port)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--server-log", action="store_true", help="show the server's output")
+    args = parser.parse_args()
+    report = asyncio.run(load_test(args))
+    show(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Rerun benchmarks for CSS-notes.py, run headlessly with Streamlit's AppTest.
+
+    python benchmarks/rerun.py run --output benchmarks/baseline.json
+    python benchmarks/rerun.py run --output current.json
+    python benchmarks/rerun.py compare benchmarks/baseline.json current.json
+
+``run`` times a cold and several warm reruns of every page, the Python heap
+peak of a rerun, and how long a rerun takes after moving the slider, typing
+in the text area and filtering a fixture upload by keyword. ``compare``
+prints both results side by side and exits with status 1 when a metric got
+worse by more than the tolerance.
+
+AppTest reruns the whole script after every widget change, but those widgets
+are in fragments, so a browser only reruns the fragment. The ``widget/*``
+times therefore include the rest of the Streamlit page and are higher than
+what a reader sees. Use them to compare two runs, and use
+benchmarks/load_test.py for the latency of real fragment reruns.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  #not available on Windows
+    resource = None
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from streamlit.util import calc_md5
+
+from fixtures import KEYWORDS, PAGES, ROOT, SLIDER_VALUES, TEXT_AREA_VALUES, scaled_csv
+
+sys.path.insert(0, ROOT)
+
+FIXTURE_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixture_app.py")
+
+#changes smaller than these are noise, however large they are in relative terms
+MIN_SECONDS = 0.005
+MIN_MB = 1.0
+
+
+def app(page, timeout):
+    at = AppTest.from_file(FIXTURE_APP, default_timeout=timeout)
+    #st.navigation picks the page from the hash of its url_path; AppTest has no public way to set it
+    at._page_hash = calc_md5(page)
+    return at
+
+
+def timed(run):
+    start = time.perf_counter()
+    run()
+    return time.perf_counter() - start
+
+
+def check(at, what):
+    if at.exception:
+        raise RuntimeError(f"{what} raised: {at.exception[0].value}")
+
+
+def peak_mb(at):
+    """Python heap peak of one rerun, in MB. Traced separately because tracemalloc slows everything down."""
+    tracemalloc.start()
+    try:
+        at.run()
+        return tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+
+
+def bench_page(page, repeats, timeout):
+    at = app(page, timeout)
+    cold = timed(at.run)
+    check(at, page)
+    warm = [timed(at.run) for _ in range(repeats)]
+    return {"cold_s": cold, "warm_s": statistics.median(warm), "warm_max_s": max(warm), "peak_mb": peak_mb(at)}
+
+
+def bench_widget(at, find, values, what):
+    """Median rerun time after setting a widget to each of ``values`` in turn."""
+    times = []
+    for value in values:
+        widget = find(at)
+        widget.set_value(value)
+        times.append(timed(at.run))
+        check(at, what)
+    return {"latency_s": statistics.median(times), "latency_max_s": max(times)}
+
+
+def labelled(elements, label):
+    return next(element for element in elements if element.label == label)
+
+
+def bench_widgets(timeout):
+    at = app("streamlit", timeout)
+    at.run()
+    check(at, "streamlit")
+    return {
+        "widget/slider": bench_widget(at, lambda at: labelled(at.slider, "Pick a number"), SLIDER_VALUES, "slider"),
+        "widget/text_area": bench_widget(at, lambda at: at.text_area[0], TEXT_AREA_VALUES, "text_area"),
+        "widget/keyword_filter": bench_widget(at, lambda at: labelled(at.text_input, "Filter by keyword"), KEYWORDS,
+                                              "keyword filter"),
+    }
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="css-report-bench-")
+    #a fresh cache directory makes the first rerun of each page read the CSVs from scratch
+    os.environ["CSS_REPORT_CACHE_DIR"] = os.path.join(workdir, "cache")
+    upload = scaled_csv(os.path.join(workdir, f"coffee-x{args.upload_scale}.csv"), args.upload_scale)
+    os.environ["CSS_REPORT_FIXTURE_UPLOAD"] = upload
+    results = {}
+    for page in PAGES:
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        results[f"page/{page}"] = bench_page(page, args.repeats, args.timeout)
+        print(f"page/{page}: cold {results[f'page/{page}']['cold_s']:.3f} s, "
+              f"warm {results[f'page/{page}']['warm_s']:.3f} s", flush=True)
+    results.update(bench_widgets(args.timeout))
+    for name in ("widget/slider", "widget/text_area", "widget/keyword_filter"):
+        print(f"{name}: {results[name]['latency_s']:.3f} s", flush=True)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "streamlit": st.__version__,
+        "machine": platform.platform(),
+        "repeats": args.repeats,
+        "upload_rows": sum(1 for _ in open(upload)) - 1,
+        "results": results,
+    }
+    if resource is not None:
+        #ru_maxrss is in kB on Linux
+        report["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {args.output}")
+
+
+def regressions(baseline, current, tolerance):
+    """(name, metric, before, after) for every metric that got worse by more than ``tolerance``."""
+    worse = []
+    for name, metrics in current["results"].items():
+        for metric, after in metrics.items():
+            before = baseline["results"].get(name, {}).get(metric)
+            if before is None:
+                continue
+            floor = MIN_MB if metric.endswith("_mb") else MIN_SECONDS
+            if after > before * (1 + tolerance) and after - before > floor:
+                worse.append((name, metric, before, after))
+    return worse
+
+
+def compare(args):
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    worse = regressions(baseline, current, args.tolerance)
+    flagged = {(name, metric) for name, metric, _, _ in worse}
+    print(f"{'benchmark':40} {'metric':14} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, metrics in current["results"].items():
+        for metric, after in metrics.items():
+            before = baseline["results"].get(name, {}).get(metric)
+            if before is None:
+                print(f"{name:40} {metric:14} {'-':>10} {after:10.3f}")
+                continue
+            change = (after - before) / before if before else 0.0
+            mark = "  REGRESSION" if (name, metric) in flagged else ""
+            print(f"{name:40} {metric:14} {before:10.3f} {after:10.3f} {change:+8.0%}{mark}")
+    if worse:
+        print(f"{len(worse)} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1)
+    print("No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="benchmark the app and write the results as JSON")
+    run_parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "baseline.json"))
+    run_parser.add_argument("--repeats", type=int, default=5, help="warm reruns per page")
+    run_parser.add_argument("--upload-scale", type=int, default=10,
+                            help="times CoffeeTruck.csv is repeated in the fixture upload")
+    run_parser.add_argument("--timeout", type=float, default=300, help="seconds allowed for one rerun")
+    run_parser.set_defaults(handler=run)
+    compare_parser = commands.add_parser("compare", help="compare two results and flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.2,
+                                help="relative slowdown allowed before a metric is flagged")
+    compare_parser.set_defaults(handler=compare)
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
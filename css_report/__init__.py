@@ -0,0 +1 @@
+"""Helpers used by the Coding Summer School report app (CSS-notes.py)."""
@@ -0,0 +1,155 @@
+"""Pearson correlation from streamed sufficient statistics."""
+import io
+import os
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from css_report.datasets import fingerprint
+
+CHUNK_ROWS = 250_000
+
+
+class CorrelationStats:
+    """Counts, sums and cross-products for pairwise-complete correlation.
+
+    For every pair of columns the statistics only include rows where both
+    values are present, the same rule DataFrame.corr() uses. Values are shifted
+    by a reference taken from the first chunk, which leaves the covariance
+    unchanged but keeps the sums small enough to avoid cancellation.
+    Memory is a few k x k matrices however many rows are added.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        size = len(self.columns)
+        self.shift = None
+        self.n = np.zeros((size, size))
+        self.sx = np.zeros((size, size))
+        self.sxx = np.zeros((size, size))
+        self.sxy = np.zeros((size, size))
+
+    def update(self, chunk):
+        values = chunk[self.columns].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        if self.shift is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)  #all-missing columns
+                self.shift = np.nan_to_num(np.nanmean(values, axis=0))
+        values = np.where(present, values - self.shift, 0.0)
+        weights = present.astype(np.float64)
+        self.n += weights.T @ weights
+        #sx[i, j] is the sum of column i over the rows where column j is present too
+        self.sx += values.T @ weights
+        self.sxx += (values * values).T @ weights
+        self.sxy += values.T @ values
+        return self
+
+    def corr(self, columns=None):
+        """Correlation matrix for ``columns`` (default: all), as a DataFrame."""
+        columns = self.columns if columns is None else list(columns)
+        pick = np.ix_(*[[self.columns.index(name) for name in columns]] * 2)
+        n, sx, sxx, sxy = self.n[pick], self.sx[pick], self.sxx[pick], self.sxy[pick]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            spread = n * sxx - sx * sx
+            result = (n * sxy - sx * sx.T) / np.sqrt(spread * spread.T)
+        result = np.clip(result, -1.0, 1.0)
+        np.fill_diagonal(result, np.where(spread.diagonal() > 0, 1.0, np.nan))
+        return pd.DataFrame(result, index=columns, columns=columns)
+
+    @classmethod
+    def from_frame(cls, frame, columns, chunk_rows=CHUNK_ROWS):
+        stats = cls(columns)
+        for start in range(0, len(frame), chunk_rows):
+            stats.update(frame.iloc[start:start + chunk_rows])
+        return stats
+
+
+def numeric_columns(frame):
+    return [name for name, column in frame.items() if is_numeric_dtype(column) and not is_bool_dtype(column)]
+
+
+def stream_csv(file, stats=None, **read_csv_args):
+    """Add every row of a CSV to ``stats`` chunk by chunk, never holding the whole table.
+
+    Without ``stats`` the statistics cover the numeric columns of the first chunk.
+    """
+    with pd.read_csv(file, chunksize=CHUNK_ROWS, **read_csv_args) as reader:
+        for chunk in reader:
+            if stats is None:
+                stats = CorrelationStats(numeric_columns(chunk))
+            stats.update(chunk)
+    return stats
+
+
+class CsvCorrelation:
+    """Correlation statistics for a CSV file, kept up to date as it changes.
+
+    Statistics cover every numeric column, so asking for another set of
+    columns never rereads the file. When the file only had rows appended,
+    just the new bytes are read; any other change starts over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = None
+        self.file_fingerprint = None
+        self.offset = None
+        self.tail = b""
+        self.header = None
+
+    def _appended(self):
+        if self.offset is None or os.path.getsize(self.path) < self.offset:
+            return False
+        with open(self.path, "rb") as file:
+            file.seek(self.offset - len(self.tail))
+            return file.read(len(self.tail)) == self.tail
+
+    def refresh(self):
+        current = fingerprint(self.path)
+        if current == self.file_fingerprint:
+            return self.stats
+        with open(self.path, "rb") as file:
+            if self.stats is not None and self._appended():
+                file.seek(self.offset)
+                stream_csv(file, self.stats, header=None, names=self.header)
+            else:
+                self.header = list(pd.read_csv(file, nrows=0).columns)
+                file.seek(0)
+                self.stats = stream_csv(file)
+            end = file.tell()
+            file.seek(max(end - 4096, 0))
+            self.tail = file.read(end - file.tell())
+        #only continue from the end next time if the last line was complete
+        self.offset = end if self.tail.endswith(b"\n") else None
+        self.file_fingerprint = current
+        return self.stats
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _csv_correlation(path):
+    return CsvCorrelation(path)
+
+
+def csv_correlation(path, columns):
+    """Correlation matrix of ``columns`` in a CSV, streamed once and updated in place."""
+    source = _csv_correlation(os.path.abspath(path))
+    with source.lock:
+        return source.refresh().corr(columns)
+
+
+@st.cache_resource(max_entries=4, show_spinner="Working out correlations...")
+def upload_correlation(upload_id, _data):
+    """Correlation matrix of an upload's numeric columns, streamed from its bytes."""
+    return stream_csv(io.BytesIO(_data)).corr()
+
+
+@st.cache_resource(max_entries=4, show_spinner="Working out correlations...")
+def frame_correlation(frame_id, _frame):
+    """Correlation matrix of the numeric columns of a loaded frame, e.g. the rows and columns chosen from an upload."""
+    return CorrelationStats.from_frame(_frame, numeric_columns(_frame)).corr()
@@ -0,0 +1,89 @@
+"""Precomputed aggregate cube over CoffeeTruck.csv."""
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from css_report.datasets import dataset_fingerprint, load_dataset
+
+DIMENSIONS = ("Location", "Music", "Price bucket")
+MEASURES = ("Sales", "Income", "Cost", "Profit")
+STATISTICS = ("sum", "count", "mean", "min", "max")
+PRICE_BUCKET_WIDTH = 5
+
+#how each stored statistic combines when cells are rolled up
+ROLLUP = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+
+def price_bucket(price, width=PRICE_BUCKET_WIDTH):
+    low = (price // width) * width
+    labels = low.astype(str) + "-" + (low + width - 1).astype(str)
+    return pd.Categorical(labels, categories=sorted(labels.unique(), key=lambda label: int(label.split("-")[0])))
+
+
+class Cube:
+    """Sum, count, min and max of every measure for every grouping of the dimensions.
+
+    The finest cuboid has one cell per Location x Music x Price bucket; the
+    others (including the grand total) are rolled up from it, so all 2^3
+    groupings exist up front. Queries only ever read these cells.
+    """
+
+    def __init__(self, frame):
+        frame = frame.assign(**{"Price bucket": price_bucket(frame["Price"])})
+        stored = {measure: list(ROLLUP) for measure in MEASURES}
+        self.base = frame.groupby(list(DIMENSIONS), observed=True).agg(stored)
+        self.rows = len(frame)
+        self.cuboids = {DIMENSIONS: self.base}
+        for size in range(len(DIMENSIONS)):
+            for dims in combinations(DIMENSIONS, size):
+                self.cuboids[dims] = self._rollup(self.base, dims)
+
+    @property
+    def cells(self):
+        return sum(len(cuboid) for cuboid in self.cuboids.values())
+
+    def values(self, dimension):
+        return list(self.base.index.get_level_values(dimension).unique().sort_values())
+
+    @staticmethod
+    def _rollup(cells, dims):
+        how = {column: ROLLUP[column[1]] for column in cells.columns}
+        if not dims:
+            return cells.agg(how).to_frame().T
+        return cells.groupby(level=list(dims), observed=True).agg(how)
+
+    def query(self, group_by=(), filters=None, measure="Profit", statistic="mean"):
+        """One statistic of a measure per group, for the cells matching ``filters``.
+
+        ``filters`` maps a dimension to the values to keep. When every filtered
+        dimension is also grouped on, the matching cuboid is sliced directly;
+        otherwise the finest cells are filtered and rolled up.
+        """
+        group_by = tuple(dim for dim in DIMENSIONS if dim in group_by)
+        filters = {dim: values for dim, values in (filters or {}).items() if values is not None}
+        direct = set(filters) <= set(group_by)
+        cells = self.cuboids[group_by] if direct else self.base
+        if filters:
+            keep = np.ones(len(cells), dtype=bool)
+            for dim, values in filters.items():
+                keep &= cells.index.get_level_values(dim).isin(values)
+            cells = cells[keep]
+        if not direct:
+            cells = self._rollup(cells, group_by)
+        if statistic == "mean":
+            result = cells[(measure, "sum")] / cells[(measure, "count")]
+        else:
+            result = cells[(measure, statistic)]
+        return result.rename(f"{statistic} of {measure}")
+
+
+@st.cache_resource(max_entries=2, show_spinner="Building the coffee truck cube...")
+def _coffee_cube(file_fingerprint):
+    return Cube(load_dataset("CoffeeTruck.csv"))
+
+
+def coffee_cube():
+    """The cube for the current CoffeeTruck.csv, built once per version of the file."""
+    return _coffee_cube(dataset_fingerprint("CoffeeTruck.csv"))
@@ -0,0 +1,125 @@
+"""Cached, typed loaders for the CSV files that ship with the report."""
+import glob
+import hashlib
+import os
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  #pyarrow comes with streamlit, but the CSV path still works without it
+    feather = None
+
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#converted copies of the CSVs live here, one Feather file per source fingerprint
+CACHE_DIR = os.environ.get("CSS_REPORT_CACHE_DIR", os.path.join(DATA_DIR, ".cache"))
+
+#read_csv arguments for each bundled file. Repeated labels become categoricals,
+#Yes/No flags become bools and numbers get the narrowest type that fits the data
+SCHEMAS = {
+    "super-animals.csv": {
+        "dtype": {"Number": "int16", "Animal": "object", "Category": "category", "Species": "category",
+                  "Age": "float32", "Weight": "float32", "Size": "float32", "Speed": "float32",
+                  "Vulnerability": "int8", "Updated": "bool"},
+        "true_values": ["Yes"],
+        "false_values": ["No"],
+    },
+    "CoffeeTruck.csv": {
+        "index_col": 0,
+        "dtype": {"Location": "category", "Music": "category", "Price": "int16", "Sales": "int16",
+                  "Income": "int32", "Cost": "int32", "Profit": "int32"},
+    },
+}
+
+
+def dataset_path(name):
+    return os.path.join(DATA_DIR, name)
+
+
+def content_fingerprint(data):
+    """Identity of an in-memory file such as an upload, from a hash of its bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def fingerprint(path):
+    """Cheap identity of a file on disk: changes whenever the file is rewritten."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def columnar_path(path, file_fingerprint):
+    mtime_ns, size = file_fingerprint
+    return os.path.join(CACHE_DIR, f"{os.path.basename(path)}.{mtime_ns}-{size}.feather")
+
+
+def _write_columnar(frame, path, file_fingerprint):
+    """Store a parsed frame as uncompressed Feather and drop copies of older versions of the CSV."""
+    target = columnar_path(path, file_fingerprint)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    #write to a temporary name first so a concurrent reader never maps a half written file
+    partial = f"{target}.{os.getpid()}.partial"
+    feather.write_feather(frame, partial, compression="uncompressed")
+    os.replace(partial, target)
+    for stale in glob.glob(os.path.join(CACHE_DIR, f"{glob.escape(os.path.basename(path))}.*.feather")):
+        if stale != target:
+            os.remove(stale)
+
+
+def read_columnar(path, file_fingerprint):
+    """Parse a bundled CSV, going through the Feather cache when pyarrow is available.
+
+    Uncompressed Feather is the Arrow IPC format, so later loads memory-map the
+    file and numeric columns are handed to pandas without copying.
+    """
+    schema = SCHEMAS[os.path.basename(path)]
+    if feather is None:
+        return pd.read_csv(path, **schema)
+    cached = columnar_path(path, file_fingerprint)
+    if os.path.exists(cached):
+        return feather.read_table(cached, memory_map=True).to_pandas(split_blocks=True)
+    frame = pd.read_csv(path, **schema)
+    try:
+        _write_columnar(frame, path, file_fingerprint)
+    except OSError:
+        pass  #read-only checkout: keep serving the parsed CSV
+    return frame
+
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def _read_typed(path, file_fingerprint):
+    return read_columnar(path, file_fingerprint)
+
+
+def dataset_fingerprint(name):
+    return fingerprint(dataset_path(name))
+
+
+def load_dataset(name):
+    """Return the typed DataFrame for a bundled file.
+
+    The frame is parsed once per process and shared by every session until the
+    file on disk changes, so callers must treat it as read-only.
+    """
+    path = dataset_path(name)
+    return _read_typed(path, fingerprint(path))
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _memory_report(path, file_fingerprint):
+    name = os.path.basename(path)
+    untyped = pd.read_csv(path, index_col=SCHEMAS[name].get("index_col"))
+    typed = _read_typed(path, file_fingerprint)
+    report = pd.DataFrame({"default dtype": untyped.dtypes.astype(str),
+                           "default bytes": untyped.memory_usage(index=False, deep=True),
+                           "typed dtype": typed.dtypes.astype(str),
+                           "typed bytes": typed.memory_usage(index=False, deep=True)})
+    report.loc["Total"] = ["", report["default bytes"].sum(), "", report["typed bytes"].sum()]
+    return report
+
+
+def memory_report(name):
+    """Bytes used by each column with default read_csv dtypes and with the schema."""
+    path = dataset_path(name)
+    return _memory_report(path, fingerprint(path))
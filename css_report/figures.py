@@ -0,0 +1,118 @@
+"""Cache of rendered matplotlib figures, stored as PNG bytes."""
+import io
+import warnings
+
+import matplotlib.pyplot as plt
+import numpy as np
+import seaborn as sns
+import streamlit as st
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+
+from css_report.lru import BoundedLRU
+
+#same rendering settings st.pyplot uses
+SAVEFIG_ARGS = {"format": "png", "bbox_inches": "tight", "dpi": 200}
+
+#above this many rows a pair plot shows binned densities instead of every point
+PAIRPLOT_MAX_ROWS = 20_000
+PAIRPLOT_BINS = 50
+
+
+@st.cache_resource(show_spinner=False)
+def figure_cache():
+    """PNG bytes keyed on dataset fingerprint and plot parameters, shared by all sessions."""
+    return BoundedLRU(max_entries=64, max_bytes=32 * 1024 ** 2)
+
+
+def render_png(figure):
+    """Render a figure to PNG bytes and release it.
+
+    Plots should be drawn on their own ``matplotlib.figure.Figure``, which is
+    freed once nothing refers to it. Figure-level seaborn plots such as
+    pairplot can only draw through pyplot, which keeps every figure it makes
+    until it is closed, so the figure is always closed here as well.
+    """
+    buffer = io.BytesIO()
+    try:
+        figure.savefig(buffer, **SAVEFIG_ARGS)
+    finally:
+        plt.close(figure)
+    return buffer.getvalue()
+
+
+def cached_png(key, draw):
+    """PNG for ``key``, calling ``draw()`` for a matplotlib figure only on a miss.
+
+    ``key`` must capture everything the plot depends on, normally a dataset
+    fingerprint plus the plot's parameters. A hit never touches matplotlib.
+    """
+    cache = figure_cache()
+    png = cache.get(key)
+    if png is None:
+        png = render_png(draw())
+        cache.put(key, png)
+    return png
+
+
+def bin_codes(values, bins):
+    """Histogram bin of every value in each column, computed for all columns at once.
+
+    Returns the codes (-1 for missing values) and the bin edges per column.
+    A column with no values at all gets the edges of 0 to 1 and only -1 codes.
+    """
+    with warnings.catch_warnings():
+        #nanmin and nanmax warn about all-missing columns, which are handled below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low = np.nanmin(values, axis=0)
+        high = np.nanmax(values, axis=0)
+    low = np.where(np.isnan(low), 0.0, low)
+    high = np.where(np.isnan(high), 1.0, high)
+    width = np.where(high > low, high - low, 1.0)
+    scaled = (values - low) / width * bins
+    codes = np.clip(np.nan_to_num(scaled, nan=-1.0), -1, bins - 1).astype(np.int64)
+    codes[np.isnan(values)] = -1
+    edges = low + np.linspace(0, 1, bins + 1)[:, None] * width
+    return codes, edges.T
+
+
+def binned_pairplot(frame, columns, bins=PAIRPLOT_BINS):
+    """Pair plot of 2D histograms, with 1D histograms on the diagonal.
+
+    Every value is binned once; each panel is then a bincount over those codes,
+    so the cost grows with the rows only through a few vectorised passes and
+    the drawing cost does not grow at all.
+    """
+    values = frame[columns].to_numpy(dtype=np.float64)
+    codes, edges = bin_codes(values, bins)
+    size = len(columns)
+    fig = Figure(figsize=(2.5 * size, 2.5 * size))
+    axes = fig.subplots(size, size, squeeze=False)
+    for i in range(size):
+        for j in range(size):
+            ax = axes[i, j]
+            if i == j:
+                valid = codes[:, j] >= 0
+                counts = np.bincount(codes[valid, j], minlength=bins)
+                ax.stairs(counts, edges[j], fill=True)
+            elif i < j:
+                valid = (codes[:, i] >= 0) & (codes[:, j] >= 0)
+                pair = np.bincount(codes[valid, i] * bins + codes[valid, j], minlength=bins * bins)
+                counts = pair.reshape(bins, bins).astype(float)
+                counts[counts == 0] = np.nan
+                #panel (i, j) plots column j against column i; (j, i) is its transpose
+                axes[i, j].pcolormesh(edges[j], edges[i], counts, norm=LogNorm(), cmap="Blues")
+                axes[j, i].pcolormesh(edges[i], edges[j], counts.T, norm=LogNorm(), cmap="Blues")
+            if i == size - 1:
+                ax.set_xlabel(columns[j])
+            if j == 0:
+                ax.set_ylabel(columns[i])
+    fig.tight_layout()
+    return fig
+
+
+def pairplot(frame, columns, max_rows=PAIRPLOT_MAX_ROWS):
+    """seaborn's pair plot for small frames, a binned density version for big ones."""
+    if len(frame) <= max_rows:
+        return sns.pairplot(frame.loc[:, columns]).figure
+    return binned_pairplot(frame, columns)
@@ -0,0 +1,143 @@
+"""Column-wise keyword filtering for uploaded tables."""
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from css_report.lru import BoundedLRU
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+
+class LoweredColumn:
+    """Lowercased text of one column, stored once per distinct value.
+
+    ``codes`` maps every row to its distinct value, so a match is worked out on
+    the distinct values and spread back to the rows with one indexing step.
+    """
+
+    def __init__(self, column):
+        #keep NaN as its own value so it matches "nan" like str(value) does
+        codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        text = pd.Index(uniques).astype(str)
+        self.codes = codes
+        if pa is not None:
+            self.values = pc.utf8_lower(pa.array(np.asarray(text, dtype=object), type=pa.large_string()))
+        else:
+            self.values = text.str.lower()
+
+    def texts(self):
+        """The distinct lowered values as Python strings, in code order."""
+        if pa is not None:
+            return self.values.to_pylist()
+        return list(self.values)
+
+    def value_matches(self, keyword, positions, exact=False):
+        """Match the keyword against a subset of the distinct values only."""
+        if pa is not None:
+            values = pc.take(self.values, pa.array(positions))
+            hits = pc.equal(values, keyword) if exact else pc.match_substring(values, keyword)
+            return hits.to_numpy(zero_copy_only=False)
+        values = self.values[positions]
+        if exact:
+            return np.asarray(values == keyword)
+        return np.asarray(values.str.contains(keyword, regex=False))
+
+    def matches(self, keyword, exact=False):
+        if pa is not None:
+            if exact:
+                hits = pc.equal(self.values, keyword)
+            else:
+                hits = pc.match_substring(self.values, keyword)
+            hits = hits.to_numpy(zero_copy_only=False)
+        elif exact:
+            hits = np.asarray(self.values == keyword)
+        else:
+            hits = np.asarray(self.values.str.contains(keyword, regex=False))
+        return hits[self.codes]
+
+
+class KeywordFilter:
+    """Keyword search across every column of a frame.
+
+    The lowered text of each column is built once, after which a search is a
+    handful of vectorised comparisons OR-ed into one row mask.
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.columns = {name: LoweredColumn(frame[name]) for name in frame.columns}
+
+    def mask(self, keyword, exact=False):
+        keyword = keyword.lower()
+        mask = np.zeros(len(self.frame), dtype=bool)
+        for column in self.columns.values():
+            mask |= column.matches(keyword, exact)
+        return mask
+
+    def rows(self, keyword, exact=False, within=None):
+        """Positions of the rows with a cell containing (or equal to) the keyword.
+
+        ``within`` limits the search to the given row positions, for example the
+        result of a shorter keyword or the candidates from a search index.
+        """
+        if within is None or len(within) * 8 > len(self.frame):
+            mask = self.mask(keyword, exact)
+            if within is None:
+                return np.flatnonzero(mask)
+            return within[mask[within]]
+        keyword = keyword.lower()
+        mask = np.zeros(len(within), dtype=bool)
+        for column in self.columns.values():
+            #only the distinct values present in these rows need checking
+            codes = column.codes[within]
+            hits = np.zeros(len(column.values), dtype=bool)
+            hits[codes] = True
+            values = np.flatnonzero(hits)
+            hits[values] = column.value_matches(keyword, values, exact)
+            mask |= hits[codes]
+        return within[mask]
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def keyword_filter(upload_fingerprint, _frame):
+    """Shared KeywordFilter for an upload, built the first time it is searched."""
+    return KeywordFilter(_frame)
+
+
+@st.cache_resource(show_spinner=False)
+def result_cache():
+    """(upload, match mode, keyword) -> matching row positions, shared by all sessions."""
+    return BoundedLRU(max_entries=256, max_bytes=64 * 1024 ** 2, sizeof=lambda rows: rows.nbytes)
+
+
+def find_rows(upload_fingerprint, search, keyword, exact=False, index=None):
+    """Rows of an upload matching a keyword, reusing earlier searches where possible.
+
+    A keyword typed before is answered from the cache. Otherwise, in substring
+    mode, the longest cached prefix of the keyword already holds every match, so
+    only its rows are searched. With no usable prefix the optional trigram index
+    is tried before falling back to a scan of the whole table.
+    """
+    keyword = keyword.lower()
+    cache = result_cache()
+    rows = cache.get((upload_fingerprint, exact, keyword))
+    if rows is not None:
+        return rows
+    within = None
+    if not exact:
+        for end in range(len(keyword) - 1, 0, -1):
+            within = cache.peek((upload_fingerprint, exact, keyword[:end]))
+            if within is not None:
+                break
+    if within is None and index is not None:
+        rows = index.rows_for(keyword, exact)
+    if rows is None:
+        rows = search.rows(keyword, exact, within)
+    #sessions share the cached arrays, so nobody may change them in place
+    rows.setflags(write=False)
+    cache.put((upload_fingerprint, exact, keyword), rows)
+    return rows
@@ -0,0 +1,275 @@
+"""Chunked parsing of uploaded CSV files with a memory budget."""
+import io
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+from pandas.api.types import is_integer_dtype, is_object_dtype, union_categoricals
+
+from css_report.datasets import content_fingerprint
+
+CHUNK_ROWS = 100_000
+SAMPLE_ROWS = 10_000
+
+#the most an upload may take once parsed, in MB
+MEMORY_BUDGET_MB = float(os.environ.get("CSS_REPORT_UPLOAD_BUDGET_MB", 1024))
+
+#uploads bigger than this are previewed while the full parse runs in the background
+PREVIEW_BYTES = 8 * 1024 ** 2
+PREVIEW_ROWS = 1000
+
+#what read_csv raises for a file that isn't a readable CSV: empty, malformed or not UTF-8
+READ_ERRORS = (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError)
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def infer_dtypes(sample):
+    """read_csv dtypes worked out from a sample of the file.
+
+    Text columns where values repeat a lot are read as categoricals. Numbers are
+    left to the parser, since a sample cannot tell how large they get, and are
+    downcast per chunk instead.
+    """
+    dtypes = {}
+    for name, column in sample.items():
+        if is_object_dtype(column) and column.nunique() <= len(column) // 2:
+            dtypes[name] = "category"
+    return dtypes
+
+
+def downcast(chunk):
+    for name, column in chunk.items():
+        if is_integer_dtype(column):
+            chunk[name] = pd.to_numeric(column, downcast="integer")
+    return chunk
+
+
+def concat_chunks(chunks):
+    """Join chunks, merging the category sets each chunk found on its own."""
+    frame = pd.concat(chunks, ignore_index=True)
+    for name in chunks[0].columns:
+        if all(isinstance(chunk[name].dtype, pd.CategoricalDtype) for chunk in chunks):
+            frame[name] = union_categoricals([chunk[name] for chunk in chunks])
+    return frame
+
+
+def read_csv_chunked(buffer, size, memory_budget=None, progress=None, chunk_rows=CHUNK_ROWS, **read_csv_args):
+    """Parse a CSV in chunks, downcasting each one and keeping under a memory budget.
+
+    ``progress`` is called with the fraction of ``size`` bytes read so far.
+    Raises MemoryBudgetExceeded as soon as the parsed rows pass
+    ``memory_budget`` bytes, before the rest of the file is read.
+    """
+    start = buffer.tell()
+    sample_rows = min(SAMPLE_ROWS, read_csv_args.get("nrows") or SAMPLE_ROWS)
+    sample = pd.read_csv(buffer, **{**read_csv_args, "nrows": sample_rows})
+    buffer.seek(start)
+    dtypes = {**infer_dtypes(sample), **read_csv_args.pop("dtype", {})}
+    chunks, used, rows = [], 0, 0
+    with pd.read_csv(buffer, dtype=dtypes, chunksize=chunk_rows, **read_csv_args) as reader:
+        for chunk in reader:
+            chunk = downcast(chunk)
+            used += chunk.memory_usage(deep=True).sum()
+            rows += len(chunk)
+            if memory_budget is not None and used > memory_budget:
+                raise MemoryBudgetExceeded(
+                    f"Stopped reading after {rows:,} rows: the file needs more than the "
+                    f"{memory_budget / 1024 ** 2:,.0f} MB allowed for an upload.")
+            chunks.append(chunk)
+            if progress is not None:
+                progress(min((buffer.tell() - start) / max(size, 1), 1.0))
+    if not chunks:
+        return sample
+    return concat_chunks(chunks)
+
+
+def preview_csv(data, head_rows=PREVIEW_ROWS, sample_rows=PREVIEW_ROWS, seed=0, **read_csv_args):
+    """First rows of a CSV plus rows sampled from the rest, without reading it all.
+
+    Sampled rows are the lines following random byte offsets, which is close
+    to a uniform sample when line lengths are similar and only touches
+    ``sample_rows`` places in the file. When a row range is given through
+    ``skiprows``/``nrows`` only the first rows of the range are shown.
+    """
+    head_args = {**read_csv_args, "nrows": min(head_rows, read_csv_args.get("nrows") or head_rows)}
+    head = pd.read_csv(io.BytesIO(data), **head_args)
+    if "skiprows" in read_csv_args or "nrows" in read_csv_args:
+        return head
+    header_end = data.find(b"\n") + 1
+    rng = random.Random(seed)
+    lines = {}
+    for _ in range(sample_rows):
+        start = data.find(b"\n", rng.randrange(header_end, len(data))) + 1
+        end = data.find(b"\n", start)
+        if 0 < start < len(data):
+            lines[start] = data[start:end if end != -1 else len(data)]
+    body = b"\n".join(lines[start] for start in sorted(lines))
+    if not body:
+        return head
+    #a line inside a quoted multi-line field can't be parsed on its own, so skip it
+    sample = pd.read_csv(io.BytesIO(data[:header_end] + body), on_bad_lines="skip", **read_csv_args)
+    return pd.concat([head, sample], ignore_index=True)
+
+
+class UploadJob:
+    """Full parse of one upload, run on a worker thread.
+
+    The worker can't touch Streamlit elements, so it only records progress;
+    the page polls ``progress``, ``frame`` and ``error``.
+    """
+
+    def __init__(self, name, data, read_csv_args):
+        self.name = name
+        self.size = len(data)
+        self.read_csv_args = read_csv_args
+        self.progress = 0.0
+        self.frame = None
+        self.error = None
+        self.done = threading.Event()
+        self._data = data
+
+    def run(self):
+        try:
+            self.frame = read_csv_chunked(io.BytesIO(self._data), self.size, MEMORY_BUDGET_MB * 1024 ** 2,
+                                          self._set_progress, **self.read_csv_args)
+        except Exception as error:  #a bad row or an exceeded budget; shown to the user by load_upload
+            self.error = error
+        finally:
+            self._data = None
+            self.done.set()
+
+    def _set_progress(self, done):
+        self.progress = done
+
+
+@st.cache_resource(show_spinner=False)
+def _upload_jobs():
+    return OrderedDict(), threading.Lock(), ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload")
+
+
+def upload_job(job_id, name, data, read_csv_args, max_uploads=4):
+    """The parse job for an upload and column choice, started on first request and shared after that.
+
+    Small files are parsed straight away on the calling thread.
+    """
+    jobs, lock, workers = _upload_jobs()
+    with lock:
+        job = jobs.get(job_id)
+        if job is not None:
+            jobs.move_to_end(job_id)
+            return job
+        job = jobs[job_id] = UploadJob(name, data, read_csv_args)
+        while len(jobs) > max_uploads:
+            jobs.popitem(last=False)
+    if len(data) > PREVIEW_BYTES:
+        workers.submit(job.run)
+    else:
+        job.run()
+    return job
+
+
+def discard_job(job_id):
+    """Forget a job, so the next request for the same upload starts a new parse."""
+    jobs, lock, _ = _upload_jobs()
+    with lock:
+        jobs.pop(job_id, None)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _preview(job_id, _data, _read_csv_args):
+    return preview_csv(_data, **_read_csv_args)
+
+
+@st.fragment(run_every=1)
+def _parse_status(job):
+    if job.done.is_set():
+        st.rerun()
+    st.progress(job.progress, text=f"Reading all of {job.name} in the background... {job.progress:.0%}")
+
+
+def choose_columns(name, data, upload_id):
+    """Let the user pick the columns and rows to read, from the header and a few rows.
+
+    Returns read_csv arguments for the choice, or None until a choice is made
+    or when the header can't be read. Files small enough to parse quickly are
+    read in full straight away.
+    """
+    try:
+        head = pd.read_csv(io.BytesIO(data), nrows=5)
+    except READ_ERRORS as error:
+        st.error(f"Could not read {name}: {error}")
+        return None
+    choice_key = f"read_{upload_id}"
+    if choice_key not in st.session_state and len(data) <= PREVIEW_BYTES:
+        st.session_state[choice_key] = {}
+    with st.form(f"columns_{upload_id}"):
+        st.write(f"The file has {len(head.columns)} columns. Only the columns you pick are read")
+        st.dataframe(head)
+        columns = st.multiselect("Columns to read", list(head.columns), default=list(head.columns))
+        col1, col2 = st.columns(2)
+        first_row = col1.number_input("First row to read", min_value=1, value=1, step=1)
+        row_count = col2.number_input("Number of rows to read (0 reads to the end)", min_value=0, value=0, step=1)
+        if st.form_submit_button("Read file", type="primary"):
+            read_csv_args = {}
+            if columns and len(columns) < len(head.columns):
+                read_csv_args["usecols"] = columns
+            if first_row > 1:
+                read_csv_args["skiprows"] = range(1, first_row)
+            if row_count:
+                read_csv_args["nrows"] = row_count
+            st.session_state[choice_key] = read_csv_args
+    return st.session_state.get(choice_key)
+
+
+def upload_fingerprint(uploaded_file):
+    """Fingerprint of an upload's bytes, hashed once per uploaded file and kept in the session.
+
+    Hashing takes about a second per 300 MB, too slow to repeat on every rerun.
+    """
+    key = f"_fingerprint_{uploaded_file.file_id}"
+    if key not in st.session_state:
+        st.session_state[key] = content_fingerprint(uploaded_file.getvalue())
+    return st.session_state[key]
+
+
+def load_upload(uploaded_file):
+    """Parse an uploaded CSV once and share the result across reruns and sessions.
+
+    Returns ``(frame_id, frame)``. The frame is None until the user has chosen
+    what to read, or after showing an error such as an exceeded memory budget.
+    While a large file is still being parsed the frame is a preview of its
+    first and sampled rows, and ``frame_id`` tells the two apart so caches
+    never mix their row positions.
+    """
+    data = uploaded_file.getvalue()
+    upload_id = upload_fingerprint(uploaded_file)
+    read_csv_args = choose_columns(uploaded_file.name, data, upload_id)
+    if read_csv_args is None:
+        return upload_id, None
+    job_id = content_fingerprint(f"{upload_id}{sorted(read_csv_args.items())}".encode())
+    job = upload_job(job_id, uploaded_file.name, data, read_csv_args)
+    if not job.done.is_set():
+        _parse_status(job)
+        try:
+            preview = _preview(job_id, data, read_csv_args)
+        except READ_ERRORS as error:
+            #the full parse reports its own error when it finishes
+            st.warning(f"Could not preview {job.name}: {error}")
+            return job_id, None
+        st.info(f"Showing a preview of {len(preview):,} rows until the whole file has been read")
+        with st.expander("Column summary of the preview"):
+            st.dataframe(preview.describe(include="all").T)
+        return f"{job_id}-preview", preview
+    if job.error is not None:
+        #a failed parse isn't kept, so uploading the file again retries it
+        discard_job(job_id)
+        st.error(f"Could not read {job.name}: {job.error}")
+        return job_id, None
+    return job_id, job.frame
@@ -0,0 +1,58 @@
+"""Thread-safe LRU caches bounded by entry count and size, shared across sessions."""
+import threading
+from collections import OrderedDict
+
+
+class BoundedLRU:
+    """LRU mapping that evicts once it holds too many entries or too many bytes.
+
+    ``sizeof`` gives the size of a value in bytes. Values bigger than the
+    whole budget are not stored. ``hits`` and ``misses`` count lookups.
+    """
+
+    def __init__(self, max_entries, max_bytes, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def peek(self, key):
+        """Look up a value without counting it or refreshing its place."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= self.sizeof(old)
+            self._entries[key] = value
+            self.nbytes += size
+            while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= self.sizeof(evicted)
@@ -0,0 +1,158 @@
+"""Opt-in tracking of memory growth across reruns, attributed to lines of the report.
+
+Set CSS_REPORT_MEMORY_TRACKER to a number N to take a tracemalloc snapshot
+every N reruns (counted over all sessions). The Memory page, which lists the
+lines whose allocations grew the most along with server file paths, is only
+shown to sessions opened with ``?admin=`` set to CSS_REPORT_ADMIN_TOKEN.
+
+Tracing starts at the end of the first rerun and slows every allocation
+after that, by more with every frame kept. A cold rerun of the Plotting
+packages page took about 4 times longer with 1 frame and about 27 times
+longer with the default 10, so only track a server while looking for a leak.
+"""
+import functools
+import hmac
+import linecache
+import os
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import streamlit as st
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "CSS-notes.py")
+
+#frames kept per allocation. More frames reach the report line behind allocations deeper inside
+#libraries, but every allocation gets slower to trace
+FRAMES = int(os.environ.get("CSS_REPORT_MEMORY_FRAMES", 10))
+TOP = 20
+
+IGNORED = [tracemalloc.Filter(False, tracemalloc.__file__),
+           tracemalloc.Filter(False, linecache.__file__),
+           tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+           tracemalloc.Filter(False, "<unknown>")]
+
+
+def snapshot_every():
+    """Reruns between snapshots, or 0 when tracking is off."""
+    try:
+        return max(int(os.environ.get("CSS_REPORT_MEMORY_TRACKER", 0)), 0)
+    except ValueError:
+        return 0
+
+
+def admin():
+    """Whether this session was opened with ``?admin=`` set to CSS_REPORT_ADMIN_TOKEN."""
+    token = os.environ.get("CSS_REPORT_ADMIN_TOKEN", "")
+    #remember the query parameter, since switching pages drops it from the URL
+    if token and hmac.compare_digest(st.query_params.get("admin", ""), token):
+        st.session_state["_admin"] = True
+    return st.session_state.get("_admin", False)
+
+
+@functools.lru_cache(maxsize=None)
+def _is_app(filename):
+    #streamlit run keeps the script path as typed, which may be relative
+    return os.path.abspath(filename) == APP_PATH
+
+
+def app_line(traceback):
+    """The innermost frame of a traceback that is in CSS-notes.py, or None."""
+    for frame in reversed(traceback):
+        if _is_app(frame.filename):
+            return frame.lineno
+    return None
+
+
+def growth_by_app_line(stats):
+    """Sum traceback differences by the CSS-notes.py line they came from, keeping the lines that grew."""
+    growth = {}
+    for stat in stats:
+        line = app_line(stat.traceback)
+        if line is not None:
+            size, count = growth.get(line, (0, 0))
+            growth[line] = (size + stat.size_diff, count + stat.count_diff)
+    rows = [{"line": line, "code": linecache.getline(APP_PATH, line).strip(), "growth_bytes": size, "blocks": count}
+            for line, (size, count) in growth.items() if size > 0]
+    return pd.DataFrame(rows, columns=["line", "code", "growth_bytes", "blocks"]).sort_values(
+        "growth_bytes", ascending=False).head(TOP)
+
+
+def growth_by_line(stats):
+    #compare_to sorts by absolute difference, which puts lines that shrank among the growers
+    growers = sorted((stat for stat in stats if stat.size_diff > 0), key=lambda stat: stat.size_diff, reverse=True)
+    rows = [{"file": stat.traceback[0].filename, "line": stat.traceback[0].lineno,
+             "growth_bytes": stat.size_diff, "blocks": stat.count_diff} for stat in growers[:TOP]]
+    return pd.DataFrame(rows, columns=["file", "line", "growth_bytes", "blocks"])
+
+
+class MemoryTracker:
+    """Counts reruns of the whole server and snapshots the heap every ``every`` of them.
+
+    Keeps the first snapshot as a baseline and the latest two, so growth can
+    be shown both since tracking began and since the last snapshot.
+    """
+
+    def __init__(self, every):
+        self.every = every
+        self.reruns = 0
+        self.first = self.previous = self.latest = None
+        self.history = []
+        self._lock = threading.Lock()
+        if tracemalloc.is_tracing() and tracemalloc.get_traceback_limit() < FRAMES:
+            tracemalloc.stop()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(FRAMES)
+
+    def tick(self):
+        with self._lock:
+            self.reruns += 1
+            if self.reruns % self.every and self.first is not None:
+                return
+            snapshot = tracemalloc.take_snapshot().filter_traces(IGNORED)
+            if self.first is None:
+                self.first = snapshot
+            self.previous, self.latest = self.latest, snapshot
+            self.history.append({"reruns": self.reruns, "time": time.strftime("%H:%M:%S"),
+                                 "traced_mb": tracemalloc.get_traced_memory()[0] / 1024 ** 2})
+
+    def growth(self, since_start=True):
+        """(by report line, by any line) for the latest snapshot against the first or the previous one."""
+        with self._lock:
+            before = self.first if since_start else self.previous
+            if before is None or self.latest is None or before is self.latest:
+                return None
+            by_traceback = self.latest.compare_to(before, "traceback")
+            by_line = self.latest.compare_to(before, "lineno")
+        return growth_by_app_line(by_traceback), growth_by_line(by_line)
+
+
+@st.cache_resource(show_spinner=False)
+def memory_tracker():
+    return MemoryTracker(snapshot_every())
+
+
+def track_memory():
+    """Count this rerun; call once at the end of the script."""
+    if snapshot_every():
+        memory_tracker().tick()
+
+
+def memory_view():
+    """Admin view of the snapshots and the lines whose memory grew the most."""
+    tracker = memory_tracker()
+    st.write(f"{tracker.reruns:,} reruns so far, with a snapshot every {tracker.every}")
+    if tracker.history:
+        st.line_chart(pd.DataFrame(tracker.history).set_index("reruns")["traced_mb"])
+    since = st.radio("Growth since", ["Tracking began", "Last snapshot"], horizontal=True)
+    growth = tracker.growth(since_start=since == "Tracking began")
+    if growth is None:
+        st.info("Growth is shown once there are two snapshots to compare")
+        return
+    by_app_line, by_line = growth
+    st.subheader("Lines of CSS-notes.py")
+    st.caption("Each allocation is counted against the innermost line of the report that led to it")
+    st.dataframe(by_app_line, hide_index=True)
+    st.subheader("Any line")
+    st.dataframe(by_line, hide_index=True)
@@ -0,0 +1,69 @@
+"""Paged table display that only sends the visible rows to the browser."""
+import math
+
+import numpy as np
+import streamlit as st
+
+PAGE_SIZES = (25, 100, 500)
+
+
+@st.cache_resource(max_entries=16, show_spinner="Sorting...")
+def _sort_order(frame_id, column, ascending, _frame):
+    """Row positions of the whole frame sorted on one column, shared by every filter."""
+    values = _frame[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+
+
+class FrameSource:
+    """Rows of an in-memory frame, optionally limited to filtered row positions.
+
+    ``frame_id`` identifies the frame's contents (e.g. the upload hash) so sort
+    orders can be cached and reused by every session and filter.
+    """
+
+    def __init__(self, frame, frame_id, rows=None):
+        self.frame = frame
+        self.frame_id = frame_id
+        self.rows = rows
+
+    @property
+    def columns(self):
+        return list(self.frame.columns)
+
+    def __len__(self):
+        return len(self.frame) if self.rows is None else len(self.rows)
+
+    def page(self, start, stop, sort_by=None, ascending=True):
+        if sort_by is None:
+            positions = np.arange(start, min(stop, len(self))) if self.rows is None else self.rows[start:stop]
+        else:
+            order = _sort_order(self.frame_id, sort_by, ascending, self.frame)
+            if self.rows is not None:
+                keep = np.zeros(len(self.frame), dtype=bool)
+                keep[self.rows] = True
+                order = order[keep[order]]
+            positions = order[start:stop]
+        return self.frame.iloc[positions]
+
+
+def paged_table(source, key):
+    """Show one page of a source with sort and paging controls.
+
+    Sorting and slicing happen on the server, so the browser only ever receives
+    one page of rows however large the source is.
+    """
+    n_rows = len(source)
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
+    sort_by = col1.selectbox("Sort by", [None] + source.columns, key=f"{key}_sort",
+                             format_func=lambda column: "File order" if column is None else column)
+    order = col2.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order", disabled=sort_by is None)
+    page_size = col3.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_size")
+    n_pages = max(1, math.ceil(n_rows / page_size))
+    #a new filter can leave fewer pages than the one that was being viewed
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    page = col4.number_input("Page", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    stop = min(start + page_size, n_rows)
+    st.dataframe(source.page(start, stop, sort_by, order == "Ascending"))
+    st.caption(f"Rows {start + 1 if n_rows else 0} to {stop} of {n_rows:,}, page {page} of {n_pages}")
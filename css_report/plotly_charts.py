@@ -0,0 +1,142 @@
+"""Plotly charts that are aggregated on the server before being sent to the browser."""
+import threading
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+
+from css_report.lru import BoundedLRU
+
+MAX_BINS = 200
+
+
+def histogram(frame, x, bins="auto"):
+    """Histogram of one column sent as a bar per bin instead of one value per row.
+
+    Bin edges follow numpy's ``bins`` rule (capped at MAX_BINS bins), so the
+    figure size depends on the number of bins, not on the number of rows.
+    """
+    values = frame[x].dropna().to_numpy(dtype=np.float64)
+    edges = np.histogram_bin_edges(values, bins=bins)
+    if len(edges) > MAX_BINS + 1:
+        edges = np.histogram_bin_edges(values, bins=MAX_BINS)
+    counts, edges = np.histogram(values, bins=edges)
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges),
+                           customdata=np.column_stack([edges[:-1], edges[1:]]),
+                           hovertemplate=f"{x}=%{{customdata[0]:.4g}} - %{{customdata[1]:.4g}}<br>count=%{{y}}<extra></extra>"))
+    fig.update_layout(bargap=0, xaxis_title=x, yaxis_title="count")
+    return fig
+
+
+def bar(frame, x, y=None, agg="sum"):
+    """Bar chart with one bar per group of ``x``.
+
+    With ``y`` the bars are the ``agg`` of ``y`` per group (the height plotly
+    would get by stacking one segment per row); without it they are counts.
+    """
+    groups = frame.groupby(x, observed=True, sort=True)
+    heights = groups.size() if y is None else groups[y].agg(agg)
+    fig = go.Figure(go.Bar(x=heights.index.astype(str), y=heights.to_numpy()))
+    fig.update_layout(xaxis_title=x, yaxis_title="count" if y is None else y)
+    return fig
+
+
+def lttb(x, y, n_out):
+    """Positions of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept. Every bucket in between keeps
+    the point forming the largest triangle with the point kept from the
+    previous bucket and the mean of the next bucket, which preserves the
+    visual shape of the trace, peaks included.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        after = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        mean_x, mean_y = x[stop:after].mean(), y[stop:after].mean()
+        area = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def minmax(x, y, n_out):
+    """Positions of the lowest and highest point in each of ``n_out // 2`` buckets.
+
+    Cheaper than LTTB and never hides an extreme value, which suits noisy traces.
+    """
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    kept = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start:
+            kept.extend(sorted((start + int(np.argmin(y[start:stop])), start + int(np.argmax(y[start:stop])))))
+    return np.unique(kept)
+
+
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax}
+
+
+def line(frame, x, y, title=None, max_points=2000, x_range=None, method="lttb"):
+    """Line chart of a trace sorted on ``x``, cut down to at most ``max_points`` points.
+
+    ``x_range`` limits the chart to a window before downsampling, so zooming in
+    (e.g. with a range slider) shows finer detail with the same payload size.
+    """
+    xs = frame[x].to_numpy()
+    ys = frame[y].to_numpy(dtype=np.float64)
+    if x_range is not None:
+        start, stop = np.searchsorted(xs, x_range[0], "left"), np.searchsorted(xs, x_range[1], "right")
+        xs, ys = xs[start:stop], ys[start:stop]
+    kept = DOWNSAMPLERS[method](xs.astype(np.float64), ys, max_points)
+    fig = go.Figure(go.Scatter(x=xs[kept], y=ys[kept], mode="lines"))
+    fig.update_layout(title=title, xaxis_title=x, yaxis_title=y)
+    return fig
+
+
+class FigureCache(BoundedLRU):
+    """Built Plotly figures keyed on data fingerprint and chart parameters.
+
+    Building a figure (aggregating, downsampling, validating every property)
+    is the expensive part; st.plotly_chart serialises a ready figure in about
+    a millisecond. Entries are sized by their JSON, and ``saved_seconds`` adds
+    up the build time every hit avoided. Cached figures are shared by all
+    sessions and must not be modified.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=32 * 1024 ** 2):
+        super().__init__(max_entries, max_bytes, sizeof=lambda entry: entry[1])
+        self.saved_seconds = 0.0
+        self._saved_lock = threading.Lock()
+
+    def figure(self, key, build):
+        entry = self.get(key)
+        if entry is not None:
+            with self._saved_lock:
+                self.saved_seconds += entry[2]
+            return entry[0]
+        start = time.perf_counter()
+        fig = build()
+        build_seconds = time.perf_counter() - start
+        self.put(key, (fig, len(fig.to_json()), build_seconds))
+        return fig
+
+
+@st.cache_resource(show_spinner=False)
+def plotly_figure_cache():
+    return FigureCache()
+
+
+def cached_figure(key, build):
+    """The figure for ``key``, calling ``build()`` only the first time in this process."""
+    return plotly_figure_cache().figure(key, build)
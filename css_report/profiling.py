@@ -0,0 +1,147 @@
+"""Per-section timings of a rerun, shown in the sidebar and appended to a JSONL log.
+
+Off unless the CSS_REPORT_PROFILE environment variable is set, so normal
+reruns only pay for one check. Set it to 1 to profile every session, or to
+``param`` to profile only sessions opened with ``?profile=1``; visitors can't
+turn profiling on otherwise. With 1, the first profiled rerun starts
+tracemalloc for the whole process and it stays on from then on, which makes
+Python code run up to a few times slower, so compare wall times between
+profiled reruns only. With ``param`` tracing is never started, so visitors
+can't slow the server down, and memory is only recorded if the memory
+tracker has started tracing.
+
+Fragment reruns skip the top and bottom of the script, so fragments decorated
+with ``fragment`` time their own reruns. Those are logged as they happen and
+listed in the sidebar from the next full rerun on.
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from css_report.datasets import CACHE_DIR
+from css_report.memory_tracker import FRAMES, snapshot_every, track_memory
+
+LOG_PATH = os.environ.get("CSS_REPORT_PROFILE_LOG", os.path.join(CACHE_DIR, "profile.jsonl"))
+
+#reruns kept in the sidebar history of each session
+HISTORY = 20
+
+_log_lock = threading.Lock()
+
+
+def fragment_rerun():
+    """Whether this run of the script only reruns fragments."""
+    ctx = get_script_run_ctx()
+    return bool(ctx and ctx.fragment_ids_this_run)
+
+
+def enabled():
+    setting = os.environ.get("CSS_REPORT_PROFILE", "")
+    if setting != "param":
+        return bool(setting)
+    #remember the query parameter, since switching pages drops it from the URL
+    if st.query_params.get("profile") in ("1", "true"):
+        st.session_state["_profile"] = True
+    return st.session_state.get("_profile", False)
+
+
+@st.cache_resource(show_spinner=False)
+def _start_tracing():
+    """Start tracemalloc once for the process; sections never stop it, since other sessions share it."""
+    if not tracemalloc.is_tracing():
+        #trace as deep as the memory tracker wants, so it never has to restart tracing
+        tracemalloc.start(FRAMES if snapshot_every() else 1)
+    return True
+
+
+def start_profile():
+    """Begin the records of a new rerun; call once at the top of the script."""
+    if enabled():
+        st.session_state["_profile_records"] = []
+
+
+def _append_log(record):
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    line = json.dumps(record) + "\n"
+    with _log_lock, open(LOG_PATH, "a") as file:
+        file.write(line)
+
+
+@contextmanager
+def section(name):
+    """Time one section of the report: wall time, CPU time of this session's thread and bytes retained.
+
+    The retained bytes are the net growth of the memory traced by tracemalloc
+    while the section runs, so memory allocated and freed again within the
+    section isn't counted and the number can be negative. Tracing covers the
+    whole process, so other sessions' reruns at the same time are counted too.
+    They are None when tracemalloc isn't tracing.
+    """
+    if not enabled():
+        yield
+        return
+    if os.environ.get("CSS_REPORT_PROFILE") != "param":
+        _start_tracing()
+    records = st.session_state.setdefault("_profile_fragment_records" if fragment_rerun() else "_profile_records", [])
+    memory_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        memory_after = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  "session": get_script_run_ctx().session_id,
+                  "section": name, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6),
+                  "retained_bytes": None if None in (memory_before, memory_after) else memory_after - memory_before}
+        records.append(record)
+        del records[:-HISTORY]
+        _append_log(record)
+
+
+def fragment(name, **fragment_args):
+    """``st.fragment`` whose own reruns are timed as section ``name`` and counted by the memory tracker.
+
+    When the fragment runs as part of a full rerun it is left to the page's
+    section and the count at the end of the script.
+    """
+    def decorate(body):
+        @functools.wraps(body)
+        def run(*args, **kwargs):
+            if not fragment_rerun():
+                return body(*args, **kwargs)
+            with section(name):
+                result = body(*args, **kwargs)
+            track_memory()
+            return result
+        return st.fragment(run, **fragment_args)
+    return decorate
+
+
+def show_profile():
+    """Sidebar panel with this rerun's sections and the total wall time of the last few reruns."""
+    if not enabled():
+        return
+    records = st.session_state.get("_profile_records", [])
+    history = st.session_state.setdefault("_profile_history", [])
+    history.append(sum(record["wall_s"] for record in records))
+    del history[:-HISTORY]
+    with st.sidebar.expander("Profile", expanded=True):
+        if records:
+            table = pd.DataFrame(records).set_index("section")
+            st.dataframe(table[["wall_s", "cpu_s", "retained_bytes"]])
+        st.line_chart(pd.Series(history, name="Rerun wall time (s)"), height=150)
+        fragment_records = st.session_state.get("_profile_fragment_records", [])
+        if fragment_records:
+            st.write("Fragment reruns")
+            st.dataframe(pd.DataFrame(fragment_records).set_index("section")[["wall_s", "cpu_s", "retained_bytes"]])
+        st.caption("retained_bytes is the net growth of traced memory; memory allocated and freed within a section "
+                   f"isn't measured. Also appended to {LOG_PATH}")
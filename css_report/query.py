@@ -0,0 +1,99 @@
+"""Validated, cached row queries written as pandas query expressions."""
+import ast
+import re
+import warnings
+
+import numpy as np
+import streamlit as st
+
+from css_report.lru import BoundedLRU
+
+try:
+    import numexpr  # noqa: F401
+    ENGINE = "numexpr"
+except ImportError:
+    ENGINE = "python"
+
+#syntax a query may use: comparisons, boolean logic, arithmetic, constants and lists of constants
+ALLOWED_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Invert, ast.USub, ast.UAdd,
+                 ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.BitAnd, ast.BitOr,
+                 ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+                 ast.Name, ast.Load, ast.Constant, ast.List, ast.Tuple)
+#pandas works out constant arithmetic in Python before evaluating, so queries are kept small
+MAX_QUERY_LENGTH = 500
+MAX_QUERY_NODES = 200
+
+BACKTICKED = re.compile(r"`([^`]*)`")
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def normalize(expression, columns):
+    """Check an expression only uses allowed syntax and known columns; return it in canonical form.
+
+    Column names that aren't identifiers go in backticks, as in DataFrame.query.
+    The canonical form ignores spacing, redundant brackets and quote style, so
+    equivalent queries share a cache entry.
+    """
+    if len(expression) > MAX_QUERY_LENGTH:
+        raise InvalidQuery(f"Queries can be at most {MAX_QUERY_LENGTH} characters long")
+    quoted = {}
+
+    def placeholder(match):
+        quoted[f"__column_{len(quoted)}"] = match.group(1)
+        return f"__column_{len(quoted) - 1}"
+
+    try:
+        tree = ast.parse(BACKTICKED.sub(placeholder, expression.strip()), mode="eval")
+    except SyntaxError as error:
+        raise InvalidQuery(f"The query is not valid: {error.msg}") from None
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_QUERY_NODES:
+        raise InvalidQuery("The query is too long")
+    for node in nodes:
+        if not isinstance(node, ALLOWED_NODES):
+            raise InvalidQuery(f"Queries can't use {type(node).__name__} expressions")
+        if isinstance(node, ast.BinOp) and not any(isinstance(child, ast.Name) for child in ast.walk(node)):
+            raise InvalidQuery(f"Write '{ast.unparse(node)}' as a single number")
+        if isinstance(node, ast.Name):
+            name = quoted.get(node.id, node.id)
+            if name not in columns:
+                raise InvalidQuery(f"There is no column called '{name}'")
+            node.id = name if name.isidentifier() else f"`{name}`"
+    return ast.unparse(tree)
+
+
+@st.cache_resource(show_spinner=False)
+def query_cache():
+    """(dataset fingerprint, canonical query) -> matching row positions, shared by all sessions."""
+    return BoundedLRU(max_entries=256, max_bytes=64 * 1024 ** 2, sizeof=lambda rows: rows.nbytes)
+
+
+def query_rows(frame, frame_id, expression):
+    """Positions of the rows where ``expression`` holds.
+
+    Evaluated with numexpr when it is installed, which runs the arithmetic and
+    comparisons vectorised across all cores. Raises InvalidQuery for anything
+    that isn't a valid condition on the frame's columns.
+    """
+    canonical = normalize(expression, set(frame.columns))
+    cache = query_cache()
+    rows = cache.get((frame_id, canonical))
+    if rows is None:
+        try:
+            with warnings.catch_warnings():
+                #numexpr hands categorical comparisons back to the python engine; that's expected
+                warnings.simplefilter("ignore", RuntimeWarning)
+                mask = frame.eval(canonical, engine=ENGINE)
+        except Exception as error:  #type errors, e.g. comparing text with a number
+            raise InvalidQuery(f"The query could not be run: {error}") from None
+        mask = np.asarray(mask)
+        if mask.dtype != bool:
+            raise InvalidQuery("The query must be a condition, e.g. Profit < 0")
+        #a condition on constants only, e.g. 1 < 2, gives one bool for every row
+        rows = np.flatnonzero(np.broadcast_to(mask, len(frame)))
+        rows.setflags(write=False)
+        cache.put((frame_id, canonical), rows)
+    return rows
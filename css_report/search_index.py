@@ -0,0 +1,91 @@
+"""Trigram index for repeated keyword searches over one uploaded table."""
+import sys
+import time
+
+import numpy as np
+import streamlit as st
+
+GRAM = 3
+
+#above this share of the table a plain column scan beats intersecting postings
+SCAN_FRACTION = 0.05
+
+
+def trigrams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class TrigramIndex:
+    """Posting lists from every trigram in the table to the rows containing it.
+
+    A keyword of three or more characters can only match rows that hold all of
+    its trigrams, so a lookup intersects a few posting lists and then checks
+    just those candidate rows. Postings are kept as one sorted int32 array
+    with offsets, indexed by trigram id.
+    """
+
+    def __init__(self, search):
+        start = time.perf_counter()
+        self.search = search
+        n_rows = len(search.frame)
+        self.ids = {}
+        keys = []
+        for column in search.columns.values():
+            gram_ids, value_ids = [], []
+            for value_id, text in enumerate(column.texts()):
+                for gram in trigrams(text):
+                    gram_ids.append(self.ids.setdefault(gram, len(self.ids)))
+                    value_ids.append(value_id)
+            if not gram_ids:
+                continue
+            #expand (trigram, distinct value) pairs to (trigram, row) pairs
+            order = np.argsort(column.codes, kind="stable")
+            counts = np.bincount(column.codes, minlength=len(column.values))
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            value_ids = np.asarray(value_ids, dtype=np.int64)
+            repeats = counts[value_ids]
+            first = np.repeat(starts[value_ids] - np.concatenate(([0], np.cumsum(repeats)[:-1])), repeats)
+            rows = order[first + np.arange(repeats.sum())]
+            keys.append(np.repeat(np.asarray(gram_ids, dtype=np.int64), repeats) * n_rows + rows)
+        keys = np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+        self.rows = (keys % max(n_rows, 1)).astype(np.int32)
+        self.offsets = np.searchsorted(keys // max(n_rows, 1), np.arange(len(self.ids) + 1))
+        self.build_seconds = time.perf_counter() - start
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index."""
+        keys = sum(sys.getsizeof(gram) for gram in self.ids)
+        return self.rows.nbytes + self.offsets.nbytes + sys.getsizeof(self.ids) + keys
+
+    def postings(self, gram):
+        gram_id = self.ids.get(gram)
+        if gram_id is None:
+            return np.empty(0, dtype=np.int32)
+        return self.rows[self.offsets[gram_id]:self.offsets[gram_id + 1]]
+
+    def rows_for(self, keyword, exact=False):
+        """Row positions matching the keyword.
+
+        Returns None when the index cannot help: the keyword is shorter than a
+        trigram, or even its rarest trigram is in too many rows.
+        """
+        keyword = keyword.lower()
+        if len(keyword) < GRAM:
+            return None
+        lists = sorted((self.postings(gram) for gram in trigrams(keyword)), key=len)
+        candidates = lists[0]
+        if len(candidates) > SCAN_FRACTION * len(self.search.frame):
+            return None
+        for postings in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, postings, assume_unique=True)
+        #the trigrams can come from different cells, so confirm each candidate
+        return self.search.rows(keyword, exact, within=candidates.astype(np.intp))
+
+
+@st.cache_resource(max_entries=4, show_spinner="Building search index...")
+def search_index(upload_fingerprint, _search):
+    """Shared TrigramIndex for an upload, built on its first indexed search."""
+    return TrigramIndex(_search)
@@ -0,0 +1,211 @@
+"""On-disk SQLite copies of uploads, for files too big to load into memory."""
+import glob
+import io
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import streamlit as st
+
+from css_report.datasets import CACHE_DIR
+
+SQLITE_DIR = os.path.join(CACHE_DIR, "uploads")
+CHUNK_ROWS = 100_000
+TABLE = "sales"
+STATISTICS = {"sum": "SUM", "count": "COUNT", "mean": "AVG", "min": "MIN", "max": "MAX"}
+
+#databases kept on disk; the least recently used are deleted past this
+MAX_DATABASES = 4
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def build_database(data, path, progress=None, chunk_rows=CHUNK_ROWS):
+    """Copy a CSV into a new SQLite file, one chunk of rows at a time.
+
+    Only one chunk is ever held as a DataFrame. The file is written under a
+    temporary name and moved into place at the end, so a half-built database
+    is never opened.
+    """
+    partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    buffer = io.BytesIO(data)
+    connection = sqlite3.connect(partial)
+    try:
+        #nothing else reads the file until it is complete, so skip the crash safety
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        with pd.read_csv(buffer, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                chunk.to_sql(TABLE, connection, if_exists="append", index=False)
+                if progress is not None:
+                    progress(min(buffer.tell() / max(len(data), 1), 1.0))
+        connection.commit()
+    #a bad row, or a rerun that interrupts the build (Streamlit raises those as BaseException)
+    except BaseException:
+        connection.close()
+        os.remove(partial)
+        raise
+    connection.close()
+    os.replace(partial, path)
+
+
+class SqliteUpload:
+    """An upload stored in SQLite, queried a page or a group at a time.
+
+    Every call opens its own read-only connection, so one instance can be
+    shared by all sessions without sharing a connection across threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index_lock = threading.Lock()
+        self._indexed = set()
+        connection = self.connect()
+        try:
+            declared = [row[1:3] for row in connection.execute(f"PRAGMA table_info({TABLE})")]
+        finally:
+            connection.close()
+        self.columns = [name for name, _ in declared]
+        #to_sql declares the column types from the dtypes of the first chunk
+        self.numeric_columns = [name for name, kind in declared if kind in ("INTEGER", "REAL")]
+
+    def connect(self, read_only=True):
+        if read_only:
+            return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def query(self, sql, params=()):
+        connection = self.connect()
+        try:
+            return pd.read_sql_query(sql, connection, params=params)
+        finally:
+            connection.close()
+
+    def count(self, where="", params=()):
+        connection = self.connect()
+        try:
+            return connection.execute(f"SELECT COUNT(*) FROM {TABLE} {where}", params).fetchone()[0]
+        finally:
+            connection.close()
+
+    def index(self, column):
+        """Index a column the first time it is sorted on, so later pages don't sort the whole table."""
+        with self._index_lock:
+            if column in self._indexed:
+                return
+            connection = self.connect(read_only=False)
+            try:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {quote('by_' + column)} ON {TABLE} ({quote(column)})")
+            finally:
+                connection.close()
+            self._indexed.add(column)
+
+    def keyword_where(self, keyword, exact=False):
+        """WHERE clause matching a keyword in any column, like KeywordFilter.
+
+        Values are compared as lowered text, with missing values read as
+        "nan". SQLite only lowers ASCII letters.
+        """
+        text = [f"lower(coalesce(CAST({quote(column)} AS TEXT), 'nan'))" for column in self.columns]
+        if exact:
+            tests = [f"{column} = :keyword" for column in text]
+        else:
+            tests = [f"instr({column}, :keyword) > 0" for column in text]
+        return "WHERE " + " OR ".join(tests), {"keyword": keyword.lower()}
+
+    def group_by(self, column, measure, statistic):
+        aggregate = f"{STATISTICS[statistic]}({quote(measure)})"
+        summary = self.query(f"SELECT {quote(column)}, {aggregate} FROM {TABLE} "
+                             f"GROUP BY {quote(column)} ORDER BY {quote(column)}")
+        #by position, since grouping a column by itself gives two columns of the same name
+        return pd.Series(summary.iloc[:, 1].to_numpy(), index=pd.Index(summary.iloc[:, 0], name=column), name=measure)
+
+
+@st.cache_data(max_entries=64, show_spinner="Counting...")
+def _count(path, where, params):
+    return SqliteUpload(path).count(where, params)
+
+
+class SqlSource:
+    """Rows of a SQLite upload, optionally limited by a WHERE clause.
+
+    Has the same interface as paging.FrameSource, so paged_table can show it;
+    each page is one LIMIT/OFFSET query.
+    """
+
+    def __init__(self, store, where="", params=()):
+        self.store = store
+        self.where = where
+        self.params = params
+
+    @property
+    def columns(self):
+        return list(self.store.columns)
+
+    def __len__(self):
+        #counting means a full scan, so keep the answer for later reruns
+        return _count(self.store.path, self.where, self.params)
+
+    def page(self, start, stop, sort_by=None, ascending=True):
+        order = "rowid"
+        if sort_by is not None:
+            self.store.index(sort_by)
+            #ordering on the bare column lets SQLite walk the index; missing values sort as smallest
+            order = f"{quote(sort_by)} {'ASC' if ascending else 'DESC'}"
+        params = dict(self.params, limit=max(stop - start, 0), offset=start)
+        return self.store.query(f"SELECT * FROM {TABLE} {self.where} ORDER BY {order} "
+                                f"LIMIT :limit OFFSET :offset", params)
+
+
+class UploadDatabases:
+    """The SQLite copies on disk, shared by all sessions and kept in least recently used order.
+
+    Every lookup moves a copy to the back, and a file is only deleted when its
+    copy is evicted from the front, so an upload someone is still paging
+    through keeps its file.
+    """
+
+    def __init__(self, max_entries=MAX_DATABASES):
+        self.max_entries = max_entries
+        self._stores = OrderedDict()
+        self._lock = threading.Lock()
+        #copies left by earlier runs of the server are opened on first use and evicted first
+        for path in sorted(glob.glob(os.path.join(SQLITE_DIR, "*.sqlite")), key=os.path.getmtime):
+            self._stores[path] = None
+
+    def get(self, upload_id, data):
+        path = os.path.join(SQLITE_DIR, f"{upload_id}.sqlite")
+        with self._lock:
+            store = self._stores.get(path)
+            if store is not None:
+                self._stores.move_to_end(path)
+                return store
+        #build outside the lock, so other sessions can page through their own copies meanwhile
+        if not os.path.exists(path):
+            with st.spinner("Copying the file into SQLite..."):
+                build_database(data, path)
+        store = SqliteUpload(path)
+        with self._lock:
+            if self._stores.get(path) is None:
+                self._stores[path] = store
+            self._stores.move_to_end(path)
+            while len(self._stores) > self.max_entries:
+                evicted, _ = self._stores.popitem(last=False)
+                if os.path.exists(evicted):
+                    os.remove(evicted)
+            return self._stores[path]
+
+
+@st.cache_resource(show_spinner=False)
+def upload_databases():
+    os.makedirs(SQLITE_DIR, exist_ok=True)
+    return UploadDatabases()
+
+
+def sqlite_upload(upload_id, data):
+    """The SQLite copy of an upload, built on first use and kept on disk between restarts."""
+    return upload_databases().get(upload_id, data)